@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""Renders many documents from one compiled template on a process pool.
+
+The compiled template is handed to each worker once, when the worker
+starts; with the "fork" start method it is simply inherited and shared
+copy-on-write, along with its render functions and copied members, which
+are built before the pool starts (see ODTFileTemplate.prepare).  Otherwise
+it is pickled once per worker, which builds those again.  A job then only
+sends its output filename and data, and gets back whether it succeeded.
+
+Results come back in job order, with at most maxPending jobs in flight, so
+any number of jobs can be fed from a generator.  A failing job is reported
+and the batch carries on.
+"""
+
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+
+workerTemplate = None
+
+def initWorker(template):
+    global workerTemplate
+    workerTemplate = template
+
+def writeJob(template, outFilename, data, compression=None):
+    template.write(outFilename, data, compression=compression)
+
+def runJob(outFilename, data, compression):
+    writeJob(workerTemplate, outFilename, data, compression)
+
+def getContext():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+def writeMany(template, jobs, workers=None, maxPending=None, compression=None):
+    """Writes each (outFilename, data) in jobs; yields (outFilename, error) in
+    job order, error being None or the exception the job raised"""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for outFilename, data in jobs:
+            try:
+                writeJob(template, outFilename, data, compression)
+            except Exception as ex:
+                yield outFilename, ex
+            else:
+                yield outFilename, None
+        return
+    if maxPending is None:
+        maxPending = workers * 4
+    # everything built on first use is built now, once, for the workers to share
+    template.prepare(compression)
+
+    def result(outFilename, future):
+        try:
+            future.result()
+        except Exception as ex:
+            return outFilename, ex
+        return outFilename, None
+
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=getContext(),
+                                                initializer=initWorker, initargs=(template,)) as executor:
+        pending = collections.deque()
+        for outFilename, data in jobs:
+            pending.append((outFilename, executor.submit(runJob, outFilename, data, compression)))
+            if len(pending) >= maxPending:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
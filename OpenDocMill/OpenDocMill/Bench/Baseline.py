@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""Benchmark results kept as JSON, and compared between runs.
+
+A baseline file holds the results of a run, by case name, with the Python
+and library versions it was made with:
+
+    {"version": "1.0", "python": "3.11.4", "results": {"report-small": {...}}}
+
+compare lists the measurements of a new run that are worse than the
+baseline's by more than a tolerance (a fraction: 0.1 is 10%).
+"""
+
+import json
+import platform
+import OpenDocMill
+
+# measurement: True if higher is better
+MEASUREMENTS = {
+    "compileSeconds": False,
+    "renderSeconds": False,
+    "rowsPerSecond": True,
+    "mbPerSecond": True,
+    "outputBytes": False,
+    "compilePeakBytes": False,
+    "renderPeakBytes": False,
+    "retainedBytes": False,
+}
+
+class Regression(object):
+    def __init__(self, case, measurement, old, new):
+        self.case = case
+        self.measurement = measurement
+        self.old = old
+        self.new = new
+
+    def getChange(self):
+        return (self.new - self.old) / self.old if self.old else float("inf")
+
+    def __str__(self):
+        return "%s: %s %.6g -> %.6g (%+.1f%%)" % (self.case, self.measurement, self.old, self.new, 100.0 * self.getChange())
+
+def save(filename, results):
+    baseline = dict(version=OpenDocMill.__version__, python=platform.python_version(), results=results)
+    with open(filename, "w") as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)["results"]
+
+def compare(baseline, results, tolerance=0.1):
+    """Returns a Regression for each measurement of each case in both baseline
+    and results that is worse in results by more than tolerance"""
+    regressions = []
+    for case, result in sorted(results.items()):
+        old = baseline.get(case)
+        if old is None: continue
+        for measurement, higherIsBetter in sorted(MEASUREMENTS.items()):
+            if measurement not in old or measurement not in result: continue
+            before, after = old[measurement], result[measurement]
+            if higherIsBetter:
+                worse = after < before * (1 - tolerance)
+            else:
+                worse = after > before * (1 + tolerance)
+            if worse:
+                regressions.append(Regression(case, measurement, before, after))
+    return regressions
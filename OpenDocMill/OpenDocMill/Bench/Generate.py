@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""Synthetic templates and data of a given shape, for benchmarks.
+
+A TemplateSpec gives the shape of a template: how many sections, fields,
+tables and columns, how much static text, whether it has a header and
+footer, and how many images.  createTemplate builds it from a blank ODT
+with TemplateCreator, and makeData builds ReportData or BookData that fill
+every field, table and image it has, with rows of escaped text.
+
+Sections are headed by a "Heading 1", as in a book template; in a report
+template the headings are just text, and all names are unique across
+sections so that one ReportData fills them.
+"""
+
+import io
+import OpenDocMill
+import OpenDocMill.TemplateCreator as TemplateCreator
+
+STYLE = "urn:oasis:names:tc:opendocument:xmlns:style:1.0"
+
+# default picture of every image placeholder; present in blank.odt
+DEFAULT_IMAGE = "Thumbnails/thumbnail.png"
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua. ")
+
+class TemplateSpec(object):
+    def __init__(self, kind="report", sections=1, fields=5, tables=1, columns=5,
+                 staticParagraphs=1, staticBytes=200, headerFooter=False, images=0):
+        if kind not in ("report", "book"):
+            raise ValueError("Unknown template kind %r" % (kind,))
+        self.kind = kind
+        self.sections = sections
+        self.fields = fields # per section
+        self.tables = tables # per section
+        self.columns = columns # per table
+        self.staticParagraphs = staticParagraphs # per section
+        self.staticBytes = staticBytes # per paragraph
+        self.headerFooter = headerFooter
+        self.images = images # per section
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+    def sectionName(self, s): return "S%d" % s
+    def fieldName(self, s, f): return "s%df%d" % (s, f)
+    def tableName(self, s, t): return "s%dt%d" % (s, t)
+    def columnName(self, c): return "c%d" % c
+    def imageName(self, s, i): return "s%dimg%d" % (s, i)
+
+def staticText(size, seed):
+    text = "%d. %s" % (seed, LOREM)
+    return (text * (size // len(text) + 1))[:size]
+
+def createImage(doc, name):
+    # in minidom, the *NS functions do not work when creating content
+    p = doc.createElement("text:p")
+    frame = doc.createElement("draw:frame")
+    frame.setAttribute("draw:name", name)
+    frame.setAttribute("text:anchor-type", "as-char")
+    frame.setAttribute("svg:width", "1cm")
+    frame.setAttribute("svg:height", "1cm")
+    image = doc.createElement("draw:image")
+    image.setAttribute("xlink:href", DEFAULT_IMAGE)
+    image.setAttribute("xlink:type", "simple")
+    image.setAttribute("xlink:show", "embed")
+    image.setAttribute("xlink:actuate", "onLoad")
+    frame.appendChild(image)
+    p.appendChild(frame)
+    return p
+
+def editContent(spec, doc):
+    decls = TemplateCreator.getVariableDecls(doc)
+    officeText = TemplateCreator.getOneByTagName(doc, TemplateCreator.OFFICE, "text")
+    for s in range(spec.sections):
+        h = doc.createElement("text:h")
+        h.setAttribute("text:outline-level", "1")
+        h.appendChild(doc.createTextNode(spec.sectionName(s)))
+        officeText.appendChild(h)
+        for i in range(spec.staticParagraphs):
+            p = doc.createElement("text:p")
+            p.setAttribute("text:style-name", "Standard")
+            p.appendChild(doc.createTextNode(staticText(spec.staticBytes, i)))
+            officeText.appendChild(p)
+        TemplateCreator.appendFields(doc, dict((spec.fieldName(s, f), "Field %d" % f) for f in range(spec.fields)),
+                                    decls, officeText)
+        for i in range(spec.images):
+            officeText.appendChild(createImage(doc, spec.imageName(s, i)))
+        for t in range(spec.tables):
+            TemplateCreator.appendTable(doc, spec.tableName(s, t),
+                                        [(spec.columnName(c), "Column %d" % c) for c in range(spec.columns)],
+                                        decls, officeText)
+
+def editStyles(doc):
+    masterPages = [x for x in doc.getElementsByTagNameNS(STYLE, "master-page")
+                   if x.getAttributeNS(STYLE, "name") == "Standard"]
+    if not masterPages:
+        raise TemplateCreator.TemplateError("Cannot find the Standard master page")
+    for part, varName in (("style:header", "headerTitle"), ("style:footer", "footerText")):
+        node = doc.createElement(part)
+        node.appendChild(TemplateCreator.createField(doc, varName, part.split(":")[1].title()))
+        masterPages[0].appendChild(node)
+
+def createTemplate(spec, inTemplateTemplate, outTemplate=None):
+    """Writes a template of spec's shape, made from the ODT inTemplateTemplate,
+    to outTemplate; returns its bytes if outTemplate is None"""
+    out = io.BytesIO() if outTemplate is None else outTemplate
+    TemplateCreator.rewrite(inTemplateTemplate, out, lambda doc: editContent(spec, doc),
+                            editStyles if spec.headerFooter else None)
+    if outTemplate is None:
+        return out.getvalue()
+
+def makeImage(s, i, size=4096):
+    # only the PNG signature is looked at
+    data = b"\x89PNG\r\n\x1a\n" + ("image %d/%d " % (s, i)).encode("ascii")
+    return (data * (size // len(data) + 1))[:size]
+
+def makeSectionData(spec, s, rows):
+    fields = dict((spec.fieldName(s, f), "Value %d of section %d & <more>" % (f, s)) for f in range(spec.fields))
+    tables = {}
+    for t in range(spec.tables):
+        tables[spec.tableName(s, t)] = [
+            dict((spec.columnName(c), "r%d c%d <%s>" % (r, c, "x" * (c % 7)) if c % 3 else r * 100 + c)
+                 for c in range(spec.columns))
+            for r in range(rows)]
+    images = dict((spec.imageName(s, i), makeImage(s, i)) for i in range(spec.images))
+    return fields, tables, images
+
+def makeData(spec, rows):
+    """ReportData or BookData filling a template of spec's shape, with rows rows per table"""
+    if spec.kind == "report":
+        fields, tables, images = {}, {}, {}
+        for s in range(spec.sections):
+            f, t, i = makeSectionData(spec, s, rows)
+            fields.update(f)
+            tables.update(t)
+            images.update(i)
+        data = OpenDocMill.ReportData(fields=fields, tables=tables, images=images)
+    else:
+        data = OpenDocMill.BookData()
+        for s in range(spec.sections):
+            f, t, i = makeSectionData(spec, s, rows)
+            data.addSection(spec.sectionName(s), fields=f, tables=t, images=i)
+    if spec.headerFooter:
+        data.setHeaderData(fields=dict(headerTitle="Benchmark report"))
+        data.setFooterData(fields=dict(footerText="Page footer"))
+    return data
+
+def countRows(spec, rows):
+    return spec.sections * spec.tables * rows
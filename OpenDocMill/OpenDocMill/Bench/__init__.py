@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""Benchmarks on synthetic templates.
+
+Each Case is a template shape (see Generate.TemplateSpec) and a number of
+rows per table.  runCase builds the template and its data, then measures:
+
+    compileSeconds     compiling the template from its bytes
+    renderSeconds      writing one document (best of repeat)
+    rowsPerSecond      table rows written per second
+    mbPerSecond        MB of XML rendered per second
+    outputBytes        size of the written document
+    compilePeakBytes   peak Python allocation while compiling (tracemalloc)
+    renderPeakBytes    peak Python allocation while writing
+    retainedBytes      allocation the compiled template keeps (see OpenDocMill.Memory)
+
+Peaks are measured in a separate pass, as tracemalloc slows everything it
+traces.  Results are plain dicts, to be stored and compared with Baseline.
+benchSuite.py runs SUITE, or the cases named on its command line.
+"""
+
+import io
+import time
+import tracemalloc
+import zipfile
+import OpenDocMill
+import OpenDocMill.Reader
+import OpenDocMill.Memory
+from OpenDocMill.Bench.Generate import TemplateSpec, createTemplate, makeData, countRows
+import OpenDocMill.Bench.Baseline
+
+class Case(object):
+    def __init__(self, name, spec, rows):
+        self.name = name
+        self.spec = spec
+        self.rows = rows # per table
+
+SUITE = [
+    Case("report-small", TemplateSpec(), 20),
+    Case("report-long-table", TemplateSpec(columns=8), 20000),
+    Case("report-wide-table", TemplateSpec(columns=60), 2000),
+    Case("report-static-text", TemplateSpec(staticParagraphs=200, staticBytes=2000), 100),
+    Case("report-header-images", TemplateSpec(headerFooter=True, images=20), 100),
+    Case("book-many-sections", TemplateSpec(kind="book", sections=500, fields=10, tables=2, columns=4), 5),
+    Case("book-full", TemplateSpec(kind="book", sections=50, fields=10, tables=3, columns=10,
+                                   staticParagraphs=5, headerFooter=True, images=2), 50),
+]
+
+def getCases(names=None):
+    if not names:
+        return list(SUITE)
+    byName = dict((x.name, x) for x in SUITE)
+    unknown = [x for x in names if x not in byName]
+    if unknown:
+        raise ValueError("Unknown benchmark cases: %s" % ", ".join(unknown))
+    return [byName[x] for x in names]
+
+def compileTemplate(spec, templateBytes):
+    if spec.kind == "book":
+        return OpenDocMill.Reader.compileBookODT(templateBytes)
+    return OpenDocMill.Reader.compileReportODT(templateBytes)
+
+def best(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def peak(function):
+    """Peak bytes allocated while function runs, above what was allocated before"""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        function()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+def renderedSize(document):
+    with zipfile.ZipFile(io.BytesIO(document)) as z:
+        return sum(z.getinfo(x).file_size for x in ("content.xml", "styles.xml"))
+
+def runCase(case, templateTemplate, repeat=3):
+    """Returns the measurements of case, with a template made from the ODT templateTemplate"""
+    templateBytes = createTemplate(case.spec, templateTemplate)
+    template = compileTemplate(case.spec, templateBytes)
+    data = makeData(case.spec, case.rows)
+    document = template.writeBytes(data) # also compiles the render functions
+
+    compileSeconds = best(lambda: compileTemplate(case.spec, templateBytes), repeat)
+    renderSeconds = best(lambda: template.writeBytes(data), repeat)
+    rows = countRows(case.spec, case.rows)
+    rendered = renderedSize(document)
+    return dict(
+        spec=case.spec.toDict(),
+        rows=rows,
+        templateBytes=len(templateBytes),
+        compileSeconds=compileSeconds,
+        renderSeconds=renderSeconds,
+        rowsPerSecond=rows / renderSeconds,
+        renderedBytes=rendered,
+        mbPerSecond=rendered / renderSeconds / 1e6,
+        outputBytes=len(document),
+        compilePeakBytes=peak(lambda: compileTemplate(case.spec, templateBytes)),
+        renderPeakBytes=peak(lambda: template.writeBytes(data)),
+        retainedBytes=OpenDocMill.Memory.traceRetained(compileTemplate, case.spec, templateBytes)[1],
+    )
+
+def runSuite(cases, templateTemplate, repeat=3):
+    """Yields (case, result) for each case"""
+    for case in cases:
+        yield case, runCase(case, templateTemplate, repeat)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""On-disk cache of compiled templates.
+
+Compiling a template means unzipping it and parsing content.xml and
+styles.xml (with the expat StreamReader, or minidom and its visitors with
+useDOM) to build the Section/Table/Row lists.  The result only depends on
+the template bytes and the reader, so it is pickled into a cache directory
+and reloaded by later processes without touching the XML at all.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import OpenDocMill
+
+# bumped when the pickled form of compiled templates changes
+CACHE_FORMAT = 2
+
+class DiskCache(object):
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+
+    def getKey(self, filename, kind, useDOM=False):
+        ### key on everything the compiled tree depends on: the template bytes,
+        ### the reader used (kind, and DOM or streaming), the library version and
+        ### cache format, and the filename (which is baked into the section
+        ### identifiers used in error messages)
+        h = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                h.update(block)
+        reader = "dom" if useDOM else "stream"
+        h.update(("\0%s\0%s\0%s\0%d\0%s" % (kind, reader, OpenDocMill.__version__, CACHE_FORMAT, filename)).encode("UTF-8"))
+        return h.hexdigest()
+
+    def getPath(self, key):
+        return os.path.join(self.cacheDir, key + ".pickle")
+
+    def load(self, key):
+        try:
+            with open(self.getPath(key), "rb") as f:
+                template = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as ex:
+            OpenDocMill.Metrics.log("OpenDocMill: recompiling, cannot load %s: %s\n" % (self.getPath(key), ex))
+            return None # stale; caller recompiles
+        if not isinstance(template, OpenDocMill.ODTFileTemplate):
+            return None
+        return template
+
+    def store(self, key, template):
+        """Returns whether the entry was written; a cache directory that cannot
+        be written (missing, read-only, full) is logged, not raised"""
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            # write to a temporary file and rename, so that a concurrent reader
+            # never sees a half-written entry
+            fd, tmpName = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+        except OSError as ex:
+            OpenDocMill.Metrics.log("OpenDocMill: not caching, cannot write to %s: %s\n" % (self.cacheDir, ex))
+            return False
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(template, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpName, self.getPath(key))
+        except BaseException as ex:
+            try:
+                os.unlink(tmpName)
+            except OSError:
+                pass
+            if not isinstance(ex, OSError):
+                raise
+            OpenDocMill.Metrics.log("OpenDocMill: not caching, cannot write %s: %s\n" % (self.getPath(key), ex))
+            return False
+        return True
+
+    def read(self, filename, kind, compile, useDOM=False):
+        """The compiled template, from the cache or by compile(filename, useDOM)"""
+        key = self.getKey(filename, kind, useDOM)
+        template = self.load(key)
+        if template is None:
+            OpenDocMill.Metrics.count("cache", result="miss")
+            template = compile(filename, useDOM)
+            self.store(key, template)
+        else:
+            OpenDocMill.Metrics.count("cache", result="hit")
+        return template
+
+    def clear(self):
+        if not os.path.isdir(self.cacheDir): return
+        for name in os.listdir(self.cacheDir):
+            if name.endswith(".pickle"):
+                os.unlink(os.path.join(self.cacheDir, name))
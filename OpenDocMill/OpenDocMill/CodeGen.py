@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""Generates specialised render functions for Section and Row.
+
+The interpreters in Section.write and Row.write unpack and dispatch on every
+element for every row.  Here each Section/Row is turned once into Python
+source that looks its fields up directly and writes one join of constant
+chunks and escaped values per run between tables, which is then exec'd.
+Values are looked up, escaped and (for images) resolved in element order,
+each lookup in its own try, so output and errors are those of the
+interpreters.
+"""
+
+import OpenDocMill
+
+def encodeConstant(eType, e):
+    if eType == "CHUNK": return e
+    return e.encode("UTF-8")
+
+class SourceBuilder(object):
+    def __init__(self):
+        self.lines = []
+        self.namespace = {
+            "Escape": OpenDocMill.Escape,
+            "imageHref": OpenDocMill.imageHref,
+        }
+        self.locals = 0
+
+    def constant(self, value):
+        name = "k%d" % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def local(self):
+        self.locals += 1
+        return "v%d" % self.locals
+
+    def line(self, indent, text):
+        self.lines.append("    " * indent + text)
+
+    def build(self, name):
+        source = "\n".join(self.lines) + "\n"
+        exec(compile(source, "<OpenDocMill.CodeGen %s>" % name, "exec"), self.namespace)
+        function = self.namespace[name]
+        function.source = source
+        return function
+
+def compileRow(row):
+    """Returns render(stream, fields, rowNo), equivalent to Row.writeInterpreted"""
+    b = SourceBuilder()
+    identifier = b.constant(row.tableIdentifier)
+    parts = []
+    values = False
+    b.line(0, "def renderRow(stream, fields, rowNo):")
+    # looked up per call, so that Escape.setMemoSize applies to compiled rows
+    b.line(1, "encodeRowValue = Escape.encodeRowValue")
+    for eType, e in row.elements:
+        if eType in ("CHUNK", "TEXT"):
+            parts.append(b.constant(encodeConstant(eType, e)))
+        elif eType == "VARIABLE":
+            name = b.constant(e)
+            value = b.local()
+            b.line(1, "try:")
+            b.line(2, "%s = fields[%s]" % (value, name))
+            b.line(1, "except KeyError:")
+            b.line(2, "raise ValueError('No value for field %%r in table %%r[row=%%d]' %% (%s, %s, rowNo))" % (name, identifier))
+            b.line(1, "%s = encodeRowValue(%s)" % (value, value))
+            parts.append(value)
+            values = True
+        else:
+            raise ValueError("Unknown type %r in template, table %r" % (eType, row.tableIdentifier))
+    if not parts:
+        b.line(1, "pass")
+    elif not values:
+        b.line(1, "stream.write(%s)" % b.constant(b"".join(b.namespace[x] for x in parts)))
+    else:
+        b.line(1, "stream.write(b''.join((%s,)))" % ", ".join(parts))
+    return b.build("renderRow")
+
+def compileSection(section):
+    """Returns render(stream, data, appendImage), equivalent to Section.writeInterpreted
+    after its type check"""
+    b = SourceBuilder()
+    identifier = b.constant(section.identifier)
+    b.line(0, "def renderSection(stream, data, appendImage):")
+    b.line(1, "fieldData = data.fields")
+    b.line(1, "tableData = data.tables")
+    b.line(1, "imageData = data.images")
+    b.line(1, "encodeFieldValue = Escape.encodeFieldValue")
+    parts = []
+
+    def flush():
+        if not parts: return
+        if len(parts) == 1:
+            b.line(1, "stream.write(%s)" % parts[0])
+        else:
+            b.line(1, "stream.write(b''.join((%s,)))" % ", ".join(parts))
+        del parts[:]
+
+    for eType, e in section.elements:
+        if eType in ("CHUNK", "TEXT"):
+            parts.append(b.constant(encodeConstant(eType, e)))
+        elif eType == "VARIABLE":
+            name = b.constant(e)
+            value = b.local()
+            b.line(1, "try:")
+            b.line(2, "%s = fieldData[%s]" % (value, name))
+            b.line(1, "except KeyError:")
+            b.line(2, "raise ValueError('No value for field %%r in section %%r' %% (%s, %s))" % (name, identifier))
+            b.line(1, "%s = encodeFieldValue(%s)" % (value, value))
+            parts.append(value)
+        elif eType == "IMAGE":
+            imageName, defaultArcFilename = e
+            value = b.local()
+            b.line(1, "%s = imageHref(imageData, %s, %s, appendImage)" % (value, b.constant(imageName), b.constant(defaultArcFilename)))
+            parts.append(value)
+        elif eType == "TABLE":
+            flush()
+            tableName, table = e
+            name = b.constant(tableName)
+            b.line(1, "try:")
+            b.line(2, "tData = tableData[%s]" % name)
+            b.line(1, "except KeyError:")
+            b.line(2, "raise ValueError('No data for table %%r in section %%r' %% (%s, %s))" % (name, identifier))
+            b.line(1, "%s.write(stream, tData)" % b.constant(table))
+        else:
+            flush()
+            b.line(1, "raise ValueError('Unknown type %%r in template, section %%r ' %% (%s, %s))" % (b.constant(eType), identifier))
+    flush()
+    return b.build("renderSection")
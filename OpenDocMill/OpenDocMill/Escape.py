@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""Escaping and encoding of values written into templates.
+
+Values go into element text (escape & and <) or into attribute values
+(escape & < and ").  Rendering writes UTF-8 bytes, so the encode* functions
+convert, escape and encode a value in one call.  Strings without special
+characters skip the replace calls entirely.
+
+encodeColumn escapes a whole column of values with one replace pass and
+one encode over the joined column.  NumPy arrays and pandas Series of
+numbers or booleans are formatted with one vectorised astype(str) and need
+no escaping at all; neither library is imported here.
+
+setMemoSize(n) turns on a bounded memo for values that repeat a lot
+(currency codes, VAT rates, dates); it applies process-wide and is off by
+default.
+"""
+
+import functools
+
+def escapeText(s):
+    if "&" in s or "<" in s:
+        return s.replace('&', '&amp;').replace('<', '&lt;')
+    return s
+
+def escapeAttr(s):
+    if "&" in s or "<" in s or '"' in s:
+        return s.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;')
+    return s
+
+def toRowString(v):
+    ### table cells: None is empty
+    if v is None: return ""
+    if isinstance(v, str): return v
+    return str(v)
+
+def encodeRowValueUncached(v):
+    if v is None: return b""
+    if not isinstance(v, str): v = str(v)
+    if "&" in v or "<" in v:
+        v = v.replace('&', '&amp;').replace('<', '&lt;')
+    return v.encode("UTF-8")
+
+def encodeFieldValueUncached(v):
+    ### section fields are always passed through str()
+    v = str(v)
+    if "&" in v or "<" in v:
+        v = v.replace('&', '&amp;').replace('<', '&lt;')
+    return v.encode("UTF-8")
+
+def encodeAttr(s):
+    return escapeAttr(s).encode("UTF-8")
+
+encodeRowValue = encodeRowValueUncached
+encodeFieldValue = encodeFieldValueUncached
+
+SEPARATOR = "\0" # cannot occur in XML text
+
+def isArray(values):
+    return hasattr(values, "dtype") and hasattr(values, "astype")
+
+def encodeColumn(values):
+    """Escaped UTF-8 for a sequence of table cell values, as encodeRowValue would give"""
+    if isArray(values) and getattr(values.dtype, "kind", None) in ("b", "i", "u", "f"):
+        # numbers never need escaping
+        strings = values.astype(str).tolist()
+        if not strings: return []
+        return SEPARATOR.join(strings).encode("UTF-8").split(b"\0")
+    strings = [toRowString(v) for v in values]
+    if not strings: return []
+    joined = SEPARATOR.join(strings)
+    encoded = escapeText(joined).encode("UTF-8").split(b"\0")
+    if len(encoded) != len(strings):
+        # a value contained the separator; do it one by one
+        return [encodeRowValueUncached(s) for s in strings]
+    return encoded
+
+def memoize(function, maxSize):
+    cached = functools.lru_cache(maxsize=maxSize, typed=True)(function)
+    def encode(v):
+        try:
+            return cached(v)
+        except TypeError: # unhashable
+            return function(v)
+    encode.cache_info = cached.cache_info
+    return encode
+
+def setMemoSize(maxSize):
+    """Memoize up to maxSize encoded values per kind; 0 or None turns the memo off"""
+    global encodeRowValue, encodeFieldValue
+    if maxSize:
+        encodeRowValue = memoize(encodeRowValueUncached, maxSize)
+        encodeFieldValue = memoize(encodeFieldValueUncached, maxSize)
+    else:
+        encodeRowValue = encodeRowValueUncached
+        encodeFieldValue = encodeFieldValueUncached
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""Images embedded in written documents.
+
+An image source in SectionData.images is a filename, the image's bytes, or
+a callable returning the bytes.  Each image is stored once per document as
+Pictures/<sha1 of the bytes><extension>, so the same picture used in many
+places, or given by several sources, becomes a single member; its media
+type for the manifest is taken from the bytes.
+
+Image files are read through a process-wide ImageCache bounded in bytes
+(see setImageCacheSize); a file is read again only when its size or
+modification time changes, so a batch embedding the same signature in
+every document reads it once.  An ImageRegistry collects the images of
+one document while it is written.
+"""
+
+import collections
+import hashlib
+import mimetypes
+import os
+import threading
+
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png", ".png"),
+    (b"\xff\xd8\xff", "image/jpeg", ".jpg"),
+    (b"GIF87a", "image/gif", ".gif"),
+    (b"GIF89a", "image/gif", ".gif"),
+    (b"II*\x00", "image/tiff", ".tif"),
+    (b"MM\x00*", "image/tiff", ".tif"),
+    (b"BM", "image/bmp", ".bmp"),
+]
+
+def getMediaType(data, filename=None):
+    """Returns (mediaType, extension) from the image's bytes, or else from its filename"""
+    for signature, mediaType, extension in SIGNATURES:
+        if data.startswith(signature):
+            return mediaType, extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp", ".webp"
+    if b"<svg" in data[:1024]:
+        return "image/svg+xml", ".svg"
+    if filename:
+        mediaType, _ = mimetypes.guess_type(filename)
+        extension = os.path.splitext(filename)[1]
+        if mediaType is not None:
+            return mediaType, extension
+    return "application/octet-stream", ""
+
+class Image(object):
+    __slots__ = ("arcName", "mediaType", "data")
+
+    def __init__(self, data, filename=None):
+        self.data = data
+        self.mediaType, extension = getMediaType(data, filename)
+        self.arcName = "Pictures/%s%s" % (hashlib.sha1(data).hexdigest(), extension)
+
+    def __repr__(self):
+        return "Image(%r, %r, %d bytes)" % (self.arcName, self.mediaType, len(self.data))
+
+class ImageCache(object):
+    """Images read from files, least recently used first out once maxBytes is passed"""
+    def __init__(self, maxBytes=32 << 20):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict() # filename: (stat, Image)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.reads = 0
+
+    def get(self, filename):
+        st = os.stat(filename)
+        stat = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is not None and entry[0] == stat:
+                self.entries.move_to_end(filename)
+                self.hits += 1
+                return entry[1]
+        with open(filename, "rb") as f:
+            image = Image(f.read(), filename)
+        with self.lock:
+            self.reads += 1
+            old = self.entries.pop(filename, None)
+            if old is not None:
+                self.size -= len(old[1].data)
+            if len(image.data) <= self.maxBytes:
+                self.entries[filename] = (stat, image)
+                self.size += len(image.data)
+                while self.size > self.maxBytes:
+                    _, (_, evicted) = self.entries.popitem(last=False)
+                    self.size -= len(evicted.data)
+        return image
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return dict(images=len(self.entries), bytes=self.size, maxBytes=self.maxBytes, hits=self.hits, reads=self.reads)
+
+imageCache = ImageCache()
+
+def setImageCacheSize(maxBytes):
+    """Bounds the bytes of image files kept in memory; 0 turns the cache off"""
+    global imageCache
+    imageCache = ImageCache(maxBytes)
+
+def getImage(source):
+    """Image for a filename, bytes, or a callable returning bytes"""
+    if isinstance(source, Image):
+        return source
+    if isinstance(source, (bytes, bytearray)):
+        return Image(bytes(source))
+    if callable(source):
+        return Image(bytes(source()))
+    return imageCache.get(os.fspath(source))
+
+def isImageSource(source):
+    return isinstance(source, (str, bytes, bytearray, os.PathLike, Image)) or callable(source)
+
+class ImageRegistry(object):
+    """The images of one document, each once, in the order first used.
+    add is passed to Section.write as appendImage."""
+    def __init__(self):
+        self.images = collections.OrderedDict() # arcName: Image
+        self.sources = {} # id(source): (source, Image), for bytes and callables
+
+    def add(self, source):
+        """Registers an image source or Image; returns its name in the document"""
+        if isinstance(source, (bytes, bytearray)) or (callable(source) and not isinstance(source, Image)):
+            # a callable is called once per document however often it is used
+            known = self.sources.get(id(source))
+            if known is None or known[0] is not source:
+                known = (source, getImage(source))
+                self.sources[id(source)] = known
+            image = known[1]
+        else:
+            image = getImage(source)
+        self.images.setdefault(image.arcName, image)
+        return image.arcName
+
+    def __iter__(self):
+        return iter(self.images.values())
+
+    def __len__(self):
+        return len(self.images)
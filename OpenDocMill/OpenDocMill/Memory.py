@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""Memory held by compiled templates and used while writing.
+
+measureTemplate walks a compiled template and adds up sys.getsizeof of
+everything it holds, by kind:
+
+    objects    the template, section, table and row objects and their dicts
+    elements   element lists and the tuples in them, before/after text lists
+    text       static text: the strings and pre-encoded chunks written as is
+    strings    identifiers, variable, table and image names, element types
+    code       generated render functions, their source and constants
+    members    template members cached for copying (see ODTFileTemplate.copyMember)
+
+Objects shared between parts are counted once.  traceRetained measures,
+with tracemalloc, what calling a function (e.g. compiling a template)
+leaves allocated, which includes what getsizeof cannot see.
+
+For the peak allocation of each phase of compiling and writing, enable
+metrics with OpenDocMill.Metrics.enable(memory=True).
+"""
+
+import gc
+import sys
+import tracemalloc
+
+CATEGORIES = ("objects", "elements", "text", "strings", "code", "members")
+
+class TemplateSize(object):
+    def __init__(self):
+        self.bytes = dict((x, 0) for x in CATEGORIES)
+        self.sections = 0
+        self.tables = 0
+        self.rows = 0
+        self.elements = 0
+        self.textFragments = 0
+        self.seen = set()
+
+    def getTotal(self):
+        return sum(self.bytes.values())
+
+    def add(self, category, ob):
+        if ob is None or id(ob) in self.seen: return
+        self.seen.add(id(ob))
+        self.bytes[category] += sys.getsizeof(ob)
+
+    def addObject(self, ob):
+        self.add("objects", ob)
+        if hasattr(ob, "__dict__"):
+            self.add("objects", ob.__dict__)
+            for key in ob.__dict__:
+                self.add("strings", key)
+
+    def addTextList(self, texts):
+        self.add("elements", texts)
+        for text in texts:
+            self.add("text", text)
+            self.textFragments += 1
+
+    def addElements(self, elements):
+        self.add("elements", elements)
+        for element in elements:
+            self.elements += 1
+            self.add("elements", element)
+            eType, e = element
+            self.add("strings", eType)
+            if eType in ("CHUNK", "TEXT"):
+                self.add("text", e)
+                self.textFragments += 1
+            elif eType == "VARIABLE":
+                self.add("strings", e)
+            elif eType == "IMAGE":
+                self.add("elements", e)
+                for name in e:
+                    self.add("strings", name)
+            elif eType == "TABLE":
+                self.add("elements", e)
+                self.add("strings", e[0])
+                self.addTable(e[1])
+
+    def addFunction(self, function):
+        if function is None: return
+        self.add("code", function)
+        self.add("code", function.__code__)
+        self.add("code", function.__code__.co_code)
+        self.add("code", getattr(function, "source", None))
+        self.add("code", function.__globals__)
+        for value in function.__globals__.values():
+            # constants; modules and helpers are shared by every function
+            if isinstance(value, (str, bytes, tuple)):
+                self.add("code", value)
+
+    def addSection(self, section):
+        if id(section) in self.seen: return
+        self.sections += 1
+        self.addObject(section)
+        self.add("strings", section.identifier)
+        self.addElements(section.elements)
+        self.addFunction(section.renderFunction)
+
+    def addTable(self, table):
+        if id(table) in self.seen: return
+        self.tables += 1
+        self.addObject(table)
+        self.add("strings", table.identifier)
+        self.addTextList(table.beforeText)
+        self.addTextList(table.afterText)
+        row = table.row
+        if row is not None and id(row) not in self.seen:
+            self.rows += 1
+            self.addObject(row)
+            self.add("strings", row.tableIdentifier)
+            self.addElements(row.elements)
+            self.addFunction(row.renderFunction)
+
+    def addXMLTemplate(self, xmlTemplate):
+        if xmlTemplate is None: return
+        self.addObject(xmlTemplate)
+        self.add("strings", xmlTemplate.identifier)
+        self.addTextList(xmlTemplate.beforeText)
+        self.addTextList(xmlTemplate.afterText)
+        for name in ("sections", "section_count", "sectionIndex"):
+            index = xmlTemplate.__dict__.get(name)
+            if index is not None:
+                self.add("objects", index)
+                for key in index:
+                    self.add("strings", key)
+        for section in xmlTemplate.getSections():
+            self.addSection(section)
+
+    def addTemplate(self, template):
+        self.addObject(template)
+        self.add("strings", template.inZipFilename)
+        self.add("members", template.inZipData)
+        if template.rawMembers is not None:
+            self.add("members", template.rawMembers)
+            for key, cached in template.rawMembers.items():
+                self.add("members", key)
+                self.add("members", cached)
+                self.add("members", cached[2])
+        self.addXMLTemplate(template.contentTemplate)
+        self.addXMLTemplate(template.stylesTemplate)
+
+    def toDict(self):
+        return dict(bytes=dict(self.bytes), total=self.getTotal(), sections=self.sections, tables=self.tables,
+                    rows=self.rows, elements=self.elements, textFragments=self.textFragments)
+
+    def report(self):
+        lines = ["%-10s %12d bytes" % (x, self.bytes[x]) for x in CATEGORIES]
+        lines.append("%-10s %12d bytes" % ("total", self.getTotal()))
+        lines.append("%d sections, %d tables, %d rows, %d elements, %d text fragments" % (
+            self.sections, self.tables, self.rows, self.elements, self.textFragments))
+        return "\n".join(lines) + "\n"
+
+def measureTemplate(template):
+    """Returns the TemplateSize of a compiled ODTFileTemplate"""
+    size = TemplateSize()
+    size.addTemplate(template)
+    return size
+
+def traceRetained(function, *args, **kwargs):
+    """Calls function; returns its result and the bytes it left allocated, as traced by tracemalloc"""
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        result = function(*args, **kwargs)
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+def report(templateName, retained, size, metrics=None):
+    """Text report of a template's memory, and of the peaks in metrics if it records them"""
+    lines = ["template %s: %d bytes retained after compiling" % (templateName, retained)]
+    lines.extend("  " + x for x in size.report().splitlines())
+    if metrics is not None and metrics.memory:
+        lines.append("peak allocation by phase:")
+        for phase, nBytes in sorted(metrics.toDict()["peakBytes"].items()):
+            lines.append("  %-28s %12d bytes" % (phase, nBytes))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""Timers and counters for compiling and writing documents.
+
+Metrics are off until enable() is called; then every phase of compiling
+(parsing content.xml and styles.xml, optimizing) and of writing (opening
+the template, rendering each XML member, deflating, copying members,
+embedding images, the manifest) is timed, and bytes, rows per table,
+images and documents are counted, process-wide.  When off, each
+instrumented point costs one module attribute lookup.
+
+    metrics = OpenDocMill.Metrics.enable()
+    ...
+    print(metrics.toJSON())         # or metrics.toPrometheus()
+
+Messages that would otherwise go to stderr are passed to log(), which
+counts them and hands them to the handler set with setLogHandler (by
+default they are dropped).  Worker processes (see Batch) each keep their
+own metrics.
+
+With enable(memory=True), each phase also records the peak of memory
+allocated during it, above what was allocated when it started, as traced
+by tracemalloc (which is started if it is not already tracing, and slows
+everything down).  tracemalloc's peak is process-wide, so peaks are only
+exact when one document is written at a time.
+"""
+
+import json
+import threading
+import time
+import tracemalloc
+
+class Timer(object):
+    __slots__ = ("metrics", "phase", "start")
+
+    def __init__(self, metrics, phase):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *excInfo):
+        self.metrics.addTime(self.phase, time.perf_counter() - self.start)
+        return False
+
+class MemoryTimer(Timer):
+    """Timer that also records the phase's peak allocation; nested phases
+    reset tracemalloc's peak, so each keeps the highest seen before them"""
+    __slots__ = ("startBytes", "peakBytes")
+
+    def __enter__(self):
+        stack = self.metrics.getMemoryStack()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1].peakBytes = max(stack[-1].peakBytes, peak)
+        tracemalloc.reset_peak()
+        self.startBytes = current
+        self.peakBytes = current
+        stack.append(self)
+        return Timer.__enter__(self)
+
+    def __exit__(self, *excInfo):
+        Timer.__exit__(self, *excInfo)
+        stack = self.metrics.getMemoryStack()
+        stack.pop()
+        self.peakBytes = max(self.peakBytes, tracemalloc.get_traced_memory()[1])
+        self.metrics.addPeak(self.phase, self.peakBytes - self.startBytes)
+        if stack:
+            stack[-1].peakBytes = max(stack[-1].peakBytes, self.peakBytes)
+        return False
+
+class NullTimer(object):
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *excInfo): return False
+
+NULL_TIMER = NullTimer()
+
+class Metrics(object):
+    def __init__(self, memory=False):
+        self.lock = threading.Lock()
+        self.memory = memory
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {} # phase: [count, seconds]
+            self.counters = {} # (name, ((label, value), ...)): total
+            self.peaks = {} # phase: highest peak bytes, if memory
+
+    def timer(self, phase):
+        if self.memory:
+            return MemoryTimer(self, phase)
+        return Timer(self, phase)
+
+    def getMemoryStack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def addPeak(self, phase, nBytes):
+        with self.lock:
+            if nBytes > self.peaks.get(phase, -1):
+                self.peaks[phase] = nBytes
+
+    def addTime(self, phase, seconds):
+        with self.lock:
+            entry = self.timers.get(phase)
+            if entry is None:
+                self.timers[phase] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def toDict(self):
+        with self.lock:
+            timers = dict((phase, dict(count=count, seconds=seconds)) for phase, (count, seconds) in sorted(self.timers.items()))
+            counters = [dict(name=name, labels=dict(labels), value=value) for (name, labels), value in sorted(self.counters.items())]
+            if self.memory:
+                return dict(timers=timers, counters=counters, peakBytes=dict(sorted(self.peaks.items())))
+        return dict(timers=timers, counters=counters)
+
+    def toJSON(self, **kwargs):
+        return json.dumps(self.toDict(), **kwargs)
+
+    def toPrometheus(self, prefix="opendocmill"):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+            peaks = sorted(self.peaks.items())
+        if timers:
+            lines.append("# TYPE %s_phase_seconds_total counter" % prefix)
+            for phase, (count, seconds) in timers:
+                lines.append('%s_phase_seconds_total{phase="%s"} %r' % (prefix, escapeLabel(phase), seconds))
+            lines.append("# TYPE %s_phase_count_total counter" % prefix)
+            for phase, (count, seconds) in timers:
+                lines.append('%s_phase_count_total{phase="%s"} %d' % (prefix, escapeLabel(phase), count))
+        if peaks:
+            lines.append("# TYPE %s_phase_peak_bytes gauge" % prefix)
+            for phase, nBytes in peaks:
+                lines.append('%s_phase_peak_bytes{phase="%s"} %d' % (prefix, escapeLabel(phase), nBytes))
+        lastName = None
+        for (name, labels), value in counters:
+            if name != lastName:
+                lines.append("# TYPE %s_%s_total counter" % (prefix, name))
+                lastName = name
+            labelText = ",".join('%s="%s"' % (k, escapeLabel(str(v))) for k, v in labels)
+            lines.append("%s_%s_total%s %r" % (prefix, name, "{%s}" % labelText if labelText else "", value))
+        return "\n".join(lines) + "\n"
+
+    def export(self, format="json"):
+        """format is one of FORMATS"""
+        if format == "json":
+            return self.toJSON() + "\n"
+        if format == "prometheus":
+            return self.toPrometheus()
+        raise ValueError("Unknown metrics format %r" % (format,))
+
+FORMATS = ("json", "prometheus")
+
+def escapeLabel(s):
+    return s.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+current = None
+logHandler = None
+
+def enable(metrics=None, memory=False):
+    """Starts collecting into metrics (a new Metrics if None, recording peak
+    allocations if memory), which is returned"""
+    global current
+    if metrics is None:
+        metrics = Metrics(memory)
+    if metrics.memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    current = metrics
+    return current
+
+def disable():
+    global current
+    current = None
+
+def timer(phase):
+    metrics = current
+    if metrics is None: return NULL_TIMER
+    return metrics.timer(phase)
+
+def count(name, value=1, **labels):
+    metrics = current
+    if metrics is not None:
+        metrics.count(name, value, **labels)
+
+def setLogHandler(handler):
+    """handler(message) receives messages passed to log, e.g. sys.stderr.write; None drops them"""
+    global logHandler
+    logHandler = handler
+
+def log(message):
+    count("messages")
+    if logHandler is not None:
+        logHandler(message)
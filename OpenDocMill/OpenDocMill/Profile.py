@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+"""Attributes render time and output bytes to template elements.
+
+While a Profiler is enabled, every Section.write and Table.write is timed
+and the bytes it writes are counted, and so is every row of a table.  The
+costs are kept in a tree of Nodes, keyed by the elements' identifiers
+(e.g. "invoiceTemplate.odt#content.xml#INVOICE/address"), so a table
+appears under the section it is written from, and its rows under it.  An
+element that is written several times (a section repeated in a book, the
+same template written for many documents) is one node that adds up.
+
+    profiler = OpenDocMill.Profile.enable()
+    template.write(out, data)
+    sys.stderr.write(profiler.report())
+
+Times and bytes include those of the node's children; "self" is what is
+left.  A table's own time includes reading its rows from the data, which
+for a generator or a DB cursor may be most of it.  Sections rendered on an
+executor's threads are profiled as well, at the top of the tree; those
+rendered in other processes are not.  When no profiler is enabled, each
+Section.write and Table.write costs one module attribute lookup.
+"""
+
+import json
+import threading
+import time
+
+class Node(object):
+    __slots__ = ("kind", "identifier", "calls", "seconds", "bytes", "rows", "children")
+
+    def __init__(self, kind, identifier):
+        self.kind = kind
+        self.identifier = identifier
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.rows = 0
+        self.children = {} # (kind, identifier): Node, in the order first written
+
+    def getChild(self, kind, identifier):
+        key = (kind, identifier)
+        node = self.children.get(key)
+        if node is None:
+            node = self.children[key] = Node(kind, identifier)
+        return node
+
+    def getSelfSeconds(self):
+        return self.seconds - sum(x.seconds for x in self.children.values())
+
+    def getSelfBytes(self):
+        return self.bytes - sum(x.bytes for x in self.children.values())
+
+    def toDict(self):
+        return dict(kind=self.kind, identifier=self.identifier, calls=self.calls, seconds=self.seconds,
+                    bytes=self.bytes, rows=self.rows, children=[x.toDict() for x in self.children.values()])
+
+class CountingStream(object):
+    """Passes writes on to stream, counting their bytes"""
+    __slots__ = ("stream", "count")
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        self.stream.write(data)
+
+class RowTimer(object):
+    """Stands in for a row's writer, adding up the time and bytes of each row"""
+    __slots__ = ("writeRow", "calls", "seconds", "bytes")
+
+    def __init__(self, writeRow):
+        self.writeRow = writeRow
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+
+    def __call__(self, stream, fields, rowNo):
+        # stream is the table's CountingStream
+        before = stream.count
+        start = time.perf_counter()
+        self.writeRow(stream, fields, rowNo)
+        self.seconds += time.perf_counter() - start
+        self.bytes += stream.count - before
+        self.calls += 1
+
+class Measure(object):
+    __slots__ = ("profiler", "kind", "identifier", "stream", "node", "start")
+
+    def __init__(self, profiler, kind, identifier, stream):
+        self.profiler = profiler
+        self.kind = kind
+        self.identifier = identifier
+        self.stream = CountingStream(stream)
+
+    def __enter__(self):
+        self.node = self.profiler.push(self.kind, self.identifier)
+        self.start = time.perf_counter()
+        return self.stream
+
+    def __exit__(self, *excInfo):
+        seconds = time.perf_counter() - self.start
+        self.profiler.pop(self.node, seconds, self.stream.count)
+        return False
+
+class Profiler(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.root = Node("root", "")
+
+    def getStack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def push(self, kind, identifier):
+        stack = self.getStack()
+        with self.lock:
+            node = (stack[-1] if stack else self.root).getChild(kind, identifier)
+        stack.append(node)
+        return node
+
+    def pop(self, node, seconds, nBytes, rows=0):
+        self.getStack().pop()
+        with self.lock:
+            node.calls += 1
+            node.seconds += seconds
+            node.bytes += nBytes
+            node.rows += rows
+
+    def measure(self, kind, identifier, stream):
+        """Context manager timing what is written inside it, to the counting
+        stream it returns, as a child of the element being written"""
+        return Measure(self, kind, identifier, stream)
+
+    def writeSection(self, section, stream, data, appendImage):
+        with self.measure("section", section.identifier, stream) as counted:
+            section.getWriter()(counted, data, appendImage)
+
+    def writeTable(self, table, stream, data):
+        with self.measure("table", table.identifier, stream) as counted:
+            rowTimer = RowTimer(table.row.getWriter())
+            rows = table.writeRows(counted, data, rowTimer)
+            stack = self.getStack()
+            with self.lock:
+                stack[-1].rows += rows
+                if rowTimer.calls:
+                    node = stack[-1].getChild("row", table.row.tableIdentifier)
+                    node.calls += rowTimer.calls
+                    node.seconds += rowTimer.seconds
+                    node.bytes += rowTimer.bytes
+                    node.rows += rowTimer.calls
+
+    def toDict(self):
+        with self.lock:
+            return self.root.toDict()
+
+    def toJSON(self, **kwargs):
+        return json.dumps(self.toDict(), **kwargs)
+
+    def report(self):
+        """The tree as text, one element per line, most expensive first"""
+        with self.lock:
+            total = sum(x.seconds for x in self.root.children.values()) or 1.0
+            lines = ["%10s %6s %10s %12s %12s %8s %8s  %s" % (
+                "seconds", "%", "self", "bytes", "self bytes", "calls", "rows", "element")]
+            self.addReportLines(lines, self.root, total, 0)
+        return "\n".join(lines) + "\n"
+
+    def addReportLines(self, lines, parent, total, depth):
+        for node in sorted(parent.children.values(), key=lambda x: -x.seconds):
+            if node.kind == "row":
+                label = "[row]"
+            elif parent.identifier and node.identifier.startswith(parent.identifier):
+                label = node.identifier[len(parent.identifier):]
+            else:
+                label = node.identifier
+            lines.append("%10.6f %5.1f%% %10.6f %12d %12d %8d %8d  %s%s" % (
+                node.seconds, 100.0 * node.seconds / total, node.getSelfSeconds(), node.bytes, node.getSelfBytes(),
+                node.calls, node.rows, "  " * depth, label))
+            self.addReportLines(lines, node, total, depth + 1)
+
+current = None
+
+def enable(profiler=None):
+    """Starts profiling into profiler (a new Profiler if None), which is returned"""
+    global current
+    current = profiler if profiler is not None else Profiler()
+    return current
+
+def disable():
+    global current
+    current = None
@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 
 import xml.dom.minidom
-import io
-import zipfile
+import os
 import OpenDocMill
 # from xml.etree import ElementTree, fromstring
 # from lxml import etree
@@ -13,6 +12,7 @@ TABLE = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
 STYLE = "urn:oasis:names:tc:opendocument:xmlns:style:1.0"
 OFFICE = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
 XLINK = "http://www.w3.org/1999/xlink"
+XMLNS = "http://www.w3.org/2000/xmlns/"
 
 DataError = OpenDocMill.DataError
 TemplateError = OpenDocMill.TemplateError
@@ -382,68 +382,179 @@ def parentTable(node):
         return node
     return node.parentNode
 
+START, END = 0, 1
+
+def findRepeatTables(events):
+    """Find tables whose last row holds variables named <tableName>.<something>.
+
+    events is a sequence of (START, node) / (END, node) pairs in document
+    order; anything else is ignored.  The last row is the last table-row
+    below the table (at any depth), and it must be a direct child of the
+    table.  Returns a list of (table, lastRow) pairs."""
+    openTables = []
+    openRows = []
+    tables = []
+    lastRows = {}
+    rowVars = {}
+    for kind, node in events:
+        if kind not in (START, END) or node.namespaceURI not in (TABLE, TEXT): continue
+        localName = node.localName
+        if kind == START:
+            if node.namespaceURI == TABLE and localName == "table":
+                tables.append(node)
+                openTables.append(node)
+            elif node.namespaceURI == TABLE and localName == "table-row":
+                for t in openTables:
+                    lastRows[id(t)] = node
+                openRows.append(node)
+            elif node.namespaceURI == TEXT and localName == "variable-set":
+                name = node.getAttributeNS(TEXT, "name")
+                for r in openRows:
+                    rowVars.setdefault(id(r), []).append(name)
+        elif node.namespaceURI == TABLE and localName == "table":
+            openTables.pop()
+        elif node.namespaceURI == TABLE and localName == "table-row":
+            openRows.pop()
+    found = []
+    for t in tables:
+        lastRow = lastRows.get(id(t))
+        if lastRow is None or t is not parentTable(lastRow): continue
+        prefix = t.getAttributeNS(TABLE, "name") + "."
+        if any(v.startswith(prefix) for v in rowVars.get(id(lastRow), ())):
+            found.append((t, lastRow))
+    return found
+
+class TemplateAnalysis(object):
+    def __init__(self):
+        self.idTables = {}
+        self.idLastRows = {}
+        self.nss = {}
+
+def analyseDocument(doc):
+    """One walk over the DOM collecting everything the visitor needs up front:
+    repeat tables and their last rows, and namespace declarations"""
+    analysis = TemplateAnalysis()
+    nss = analysis.nss
+
+    def walk():
+        todo = [(START, doc)]
+        while todo:
+            kind, node = todo.pop()
+            if kind == END:
+                yield END, node
+                continue
+            if node.nodeType == node.ELEMENT_NODE:
+                for attrName, attrValue in node.attributes.items():
+                    if attrName == "xmlns":
+                        nss[None] = attrValue
+                    elif attrName.startswith("xmlns:"):
+                        nss[attrName[6:]] = attrValue
+                yield START, node
+                todo.append((END, node))
+            elif node.nodeType != node.DOCUMENT_NODE:
+                continue
+            todo.extend((START, child) for child in reversed(node.childNodes))
+
+    for t, lastRow in findRepeatTables(walk()):
+        analysis.idTables[id(t)] = t
+        analysis.idLastRows[id(lastRow)] = lastRow
+    return analysis
+
 def getTableAndLastRowIDs(doc):
     """find table nodes which contain a last row with set-variables <tableName>.<something>"""
-    idTables = {}
-    idLastRows = {}
-    for t in doc.getElementsByTagNameNS(TABLE, "table"):
-        tableName = t.getAttributeNS(TABLE, "name")
-        lastRow = (t.getElementsByTagNameNS(TABLE, "table-row") or [None])[-1]
-        if t is not parentTable(lastRow): continue
-        v = lastRow.getElementsByTagNameNS(TEXT, "variable-set")
-        tableVars = [x for x in v if x.getAttributeNS(TEXT, "name").startswith(tableName + ".")]
-        if not tableVars: continue
-        # save table and last row ID, for efficient checking on next pass
-        idTables[id(t)] = t
-        idLastRows[id(lastRow)] = lastRow
-    return idTables, idLastRows
+    analysis = analyseDocument(doc)
+    return analysis.idTables, analysis.idLastRows
 
 def readXML(xmlStream, fileIdentifier, VisitorClass, TemplateClass, appendImage):
     doc = xml.dom.minidom.parse(xmlStream)
-    # doc = etree.parse(xmlStream)
-    # # doc = etree.string(xmlStream)
-    idTables, idLastRows = getTableAndLastRowIDs(doc)
-    nss = seek_nss(doc)  # Replace xml.dom.ext.SeekNss with empty dict for now
+    analysis = analyseDocument(doc)
     template = TemplateClass(str(fileIdentifier), appendImage)  # Changed unicode to str
-    visitor = VisitorClass(template, idTables, idLastRows, nss)
+    visitor = VisitorClass(template, analysis.idTables, analysis.idLastRows, analysis.nss)
     visitor.visit(doc)  # Use our new XMLPrinter's visit method
     return template
 
-def readBookContentXML(xmlStream, filename, appendImage):
-    return readXML(xmlStream, filename + "#content.xml", ODTBookContentVisitor, OpenDocMill.BookContentTemplate, appendImage)
+def readBookContentXML(xmlStream, filename, appendImage, useDOM=False):
+    if useDOM:
+        return readXML(xmlStream, filename + "#content.xml", ODTBookContentVisitor, OpenDocMill.BookContentTemplate, appendImage)
+    return OpenDocMill.StreamReader.streamXML(xmlStream, filename + "#content.xml", OpenDocMill.StreamReader.StreamBookContentVisitor, OpenDocMill.BookContentTemplate, appendImage)
+
+def readReportContentXML(xmlStream, filename, appendImage, useDOM=False):
+    if useDOM:
+        return readXML(xmlStream, filename + "#content.xml", ODTReportContentVisitor, OpenDocMill.ReportContentTemplate, appendImage)
+    return OpenDocMill.StreamReader.streamXML(xmlStream, filename + "#content.xml", OpenDocMill.StreamReader.StreamReportContentVisitor, OpenDocMill.ReportContentTemplate, appendImage)
+
+def readStylesXML(xmlStream, filename, appendImage, useDOM=False):
+    if useDOM:
+        return readXML(xmlStream, filename + "#styles.xml", ODTStyleVisitor, OpenDocMill.StylesTemplate, appendImage)
+    return OpenDocMill.StreamReader.streamXML(xmlStream, filename + "#styles.xml", OpenDocMill.StreamReader.StreamStyleVisitor, OpenDocMill.StylesTemplate, appendImage)
+
+def isFilename(source):
+    return isinstance(source, (str, os.PathLike))
+
+def getTemplateSource(source):
+    """Returns (filename, bytes) for a template given as a filename, bytes or a binary
+    file object; bytes is None for a filename, which names the others if it can"""
+    if isFilename(source):
+        return source, None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return "<bytes>", bytes(source)
+    name = getattr(source, "name", None)
+    return (name if isinstance(name, str) else "<bytes>"), source.read()
+
+def compileODT(filename, readContentXML, useDOM=False):
+    ### templates are compiled with the streaming expat reader (StreamReader);
+    ### useDOM=True selects the original minidom visitors instead.
+    ### Static text is then coalesced into pre-encoded chunks (see optimize),
+    ### and sections and rows are rendered by generated code (see CodeGen),
+    ### generated here along with the members copied raw (see prepare).
+    ### filename may also be the template's bytes or a binary file object.
+    with OpenDocMill.Metrics.timer("compile"):
+        filename, inZipData = getTemplateSource(filename)
+        template = OpenDocMill.ODTFileTemplate(filename, inZipData)
+        with template.openInput() as inZipFile:
+            content = inZipFile.open("content.xml")
+            styles = inZipFile.open("styles.xml")
+            with OpenDocMill.Metrics.timer("compile.content.xml"):
+                template.setContentTemplate(readContentXML(content, filename, template.appendImage, useDOM))
+            with OpenDocMill.Metrics.timer("compile.styles.xml"):
+                template.setStylesTemplate(readStylesXML(styles, filename, template.appendImage, useDOM))
+            OpenDocMill.Metrics.count("template_bytes_read", sum(inZipFile.getinfo(x).compress_size for x in ("content.xml", "styles.xml")))
+        with OpenDocMill.Metrics.timer("compile.optimize"):
+            template.optimize()
+            template.setRenderEngine("compiled")
+        with OpenDocMill.Metrics.timer("compile.prepare"):
+            template.prepare()
+    OpenDocMill.Metrics.count("templates_compiled")
+    return template
 
-def readReportContentXML(xmlStream, filename, appendImage):
-    return readXML(xmlStream, filename + "#content.xml", ODTReportContentVisitor, OpenDocMill.ReportContentTemplate, appendImage)
+def compileBookODT(filename, useDOM=False):
+    return compileODT(filename, readBookContentXML, useDOM)
 
-def readStylesXML(xmlStream, filename, appendImage):
-    return readXML(xmlStream, filename + "#styles.xml", ODTStyleVisitor, OpenDocMill.StylesTemplate, appendImage)
+def compileReportODT(filename, useDOM=False):
+    return compileODT(filename, readReportContentXML, useDOM)
 
-def readBookODT(filename):
-    template = OpenDocMill.ODTFileTemplate(filename)
-    with zipfile.ZipFile(filename, 'r') as inZipFile:
-        content = io.BytesIO(inZipFile.read("content.xml"))
-        styles = io.BytesIO(inZipFile.read("styles.xml"))
-    template.setContentTemplate(readBookContentXML(content, filename, template.appendImage))
-    template.setStylesTemplate(readStylesXML(styles, filename, template.appendImage))
-    return template
+def readBookODT(filename, cacheDir=None, useDOM=False):
+    """If cacheDir is given, the compiled template is kept there between processes;
+    templates given as bytes or a file object are always compiled"""
+    if cacheDir is not None and isFilename(filename):
+        return OpenDocMill.Cache.DiskCache(cacheDir).read(filename, "book", compileBookODT, useDOM)
+    return compileBookODT(filename, useDOM)
 
-def readReportODT(filename):
-    template = OpenDocMill.ODTFileTemplate(filename)
-    with zipfile.ZipFile(filename, 'r') as inZipFile:
-        content = io.BytesIO(inZipFile.read("content.xml"))
-        styles = io.BytesIO(inZipFile.read("styles.xml"))
-    template.setContentTemplate(readReportContentXML(content, filename, template.appendImage))
-    template.setStylesTemplate(readStylesXML(styles, filename, template.appendImage))
-    return template
+def readReportODT(filename, cacheDir=None, useDOM=False):
+    """If cacheDir is given, the compiled template is kept there between processes;
+    templates given as bytes or a file object are always compiled"""
+    if cacheDir is not None and isFilename(filename):
+        return OpenDocMill.Cache.DiskCache(cacheDir).read(filename, "report", compileReportODT, useDOM)
+    return compileReportODT(filename, useDOM)
 
-def readODT(filename):
-    return readBookODT(filename)
+def readODT(filename, cacheDir=None):
+    return readBookODT(filename, cacheDir)
 
 
 
 def seek_nss(node):
     """
-    Recursively gathers namespaces declared in a DOM tree.
+    Gathers namespaces declared in a DOM tree.
     
     Args:
         node: A DOM node.
@@ -451,22 +562,4 @@ def seek_nss(node):
     Returns:
         A dictionary mapping namespace prefixes to URIs.
     """
-    namespaces = {}
-    
-    # Check attributes for namespace declarations
-    if node.attributes:
-        for attr_name, attr_value in node.attributes.items():
-            if attr_name.startswith("xmlns"):
-                # Default namespace
-                if attr_name == "xmlns":
-                    namespaces[None] = attr_value
-                else:
-                    # Namespace with prefix
-                    prefix = attr_name.split(":")[1]
-                    namespaces[prefix] = attr_value
-
-    # Recursively check child nodes
-    for child in node.childNodes:
-        namespaces.update(seek_nss(child))
-
-    return namespaces
\ No newline at end of file
+    return analyseDocument(node).nss
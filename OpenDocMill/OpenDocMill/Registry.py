@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""In-process registry of compiled templates, for long-lived workers.
+
+    registry = OpenDocMill.Registry.TemplateRegistry(maxTemplates=50)
+    template = registry.getReport("invoiceTemplate.odt")
+    template.write(out, data)
+
+Entries are evicted least-recently-used first, by count and optionally by
+estimated memory.  Each lookup stats the file; only when the mtime or size
+has changed is the content hashed, and only when the hash has changed is the
+template recompiled.
+"""
+
+import collections
+import hashlib
+import os
+import sys
+import threading
+import OpenDocMill
+import OpenDocMill.Reader
+
+def estimateSize(ob):
+    """Approximate number of bytes held by a compiled template tree"""
+    seen = set()
+    total = 0
+    todo = [ob]
+    while todo:
+        x = todo.pop()
+        if id(x) in seen: continue
+        seen.add(id(x))
+        total += sys.getsizeof(x)
+        if isinstance(x, dict):
+            todo.extend(x.keys())
+            todo.extend(x.values())
+        elif isinstance(x, (list, tuple, set, frozenset)):
+            todo.extend(x)
+        elif hasattr(x, "__dict__") and not callable(x):
+            todo.append(x.__dict__)
+        elif hasattr(x, "__slots__") and not callable(x):
+            todo.extend(getattr(x, name, None) for name in x.__slots__)
+    return total
+
+def hashFile(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class RegistryEntry(object):
+    def __init__(self, template, stat, digest, size):
+        self.template = template
+        self.stat = stat
+        self.digest = digest
+        self.size = size
+
+class TemplateRegistry(object):
+    def __init__(self, maxTemplates=32, maxBytes=None, cacheDir=None):
+        self.maxTemplates = maxTemplates
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        self.entries = collections.OrderedDict() # (kind, abspath) -> RegistryEntry
+        self.totalBytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def getReport(self, filename): return self.get(filename, "report")
+    def getBook(self, filename): return self.get(filename, "book")
+
+    def get(self, filename, kind="report"):
+        if kind == "report":
+            reader = OpenDocMill.Reader.readReportODT
+        elif kind == "book":
+            reader = OpenDocMill.Reader.readBookODT
+        else:
+            raise ValueError("Unknown template kind %r" % (kind,))
+        key = (kind, os.path.abspath(filename))
+        st = os.stat(filename)
+        stat = (st.st_mtime_ns, st.st_size)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.stat == stat:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.template
+
+        # stat changed or not loaded: compare content before recompiling
+        digest = hashFile(filename)
+        if entry is not None and entry.digest == digest:
+            with self.lock:
+                entry.stat = stat
+                self.hits += 1
+                if key in self.entries: self.entries.move_to_end(key)
+            return entry.template
+
+        # If compiling fails (e.g. the file is half-copied), the old entry
+        # is left in place and the error goes to the caller.
+        template = reader(filename, cacheDir=self.cacheDir)
+        newEntry = RegistryEntry(template, stat, digest, estimateSize(template) if self.maxBytes else 0)
+        with self.lock:
+            if entry is None: self.misses += 1
+            else: self.reloads += 1
+            old = self.entries.pop(key, None)
+            if old is not None: self.totalBytes -= old.size
+            self.entries[key] = newEntry
+            self.totalBytes += newEntry.size
+            self.evict(keep=key)
+        return template
+
+    def evict(self, keep):
+        # called with self.lock held; never evicts the entry just added
+        while len(self.entries) > 1 and (
+                (self.maxTemplates is not None and len(self.entries) > self.maxTemplates)
+                or (self.maxBytes is not None and self.totalBytes > self.maxBytes)):
+            key, entry = next(iter(self.entries.items()))
+            if key == keep: break
+            del self.entries[key]
+            self.totalBytes -= entry.size
+            self.evictions += 1
+
+    def invalidate(self, filename=None):
+        with self.lock:
+            if filename is None:
+                self.entries.clear()
+                self.totalBytes = 0
+                return
+            path = os.path.abspath(filename)
+            for key in [k for k in self.entries if k[1] == path]:
+                self.totalBytes -= self.entries.pop(key).size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "templates": len(self.entries),
+                "bytes": self.totalBytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
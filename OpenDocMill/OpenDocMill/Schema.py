@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""Data schemas compiled from templates, for checking data before rendering.
+
+Without a schema, a missing field or table is only found when the renderer
+reaches it, after part of the document has been written.  A TemplateSchema
+lists what each section of a template uses (as getStructure does: fields,
+tables and their row columns, and also its images) and checks ReportData or BookData against
+it in one pass, raising a single DataError with every problem, worded as
+the renderer's errors are.
+
+Only the values the template uses are checked; see OpenDocMill.setValidation
+for how this replaces the checks in SectionData.  Tables given as iterators
+cannot be checked without consuming them and are left to the renderer.
+"""
+
+import OpenDocMill
+
+FIELD_TYPES = (str, bytes, int, float)
+
+class SectionSchema(object):
+    def __init__(self, section):
+        self.identifier = section.identifier
+        self.fields = []
+        self.tables = [] # (tableName, tableIdentifier, columns)
+        self.images = []
+        for eType, eVal in section.elements:
+            if eType == "VARIABLE":
+                if eVal not in self.fields: self.fields.append(eVal)
+            elif eType == "IMAGE":
+                if eVal[0] not in self.images: self.images.append(eVal[0])
+            elif eType == "TABLE":
+                tableName, table = eVal
+                columns = []
+                for name in OpenDocMill.getStructure(table):
+                    if name not in columns: columns.append(name)
+                self.tables.append((tableName, table.identifier, frozenset(columns)))
+
+    def getErrors(self, data):
+        if not isinstance(data, OpenDocMill.SectionData):
+            return ["Expected SectionData object, not %r" % type(data)]
+        errors = []
+        fields = data.fields
+        for name in self.fields:
+            if name not in fields:
+                errors.append("No value for field %r in section %r" % (name, self.identifier))
+            elif not isinstance(fields[name], FIELD_TYPES):
+                errors.append("Bad type for field %r in section %r: %r" % (name, self.identifier, type(fields[name])))
+        for tableName, tableIdentifier, columns in self.tables:
+            if tableName not in data.tables:
+                errors.append("No data for table %r in section %r" % (tableName, self.identifier))
+                continue
+            error = self.getTableError(data.tables[tableName], tableName, tableIdentifier, columns)
+            if error: errors.append(error)
+        for name in self.images:
+            # a missing image keeps the template's picture
+            source = data.images.get(name)
+            if source is not None and not OpenDocMill.Images.isImageSource(source):
+                errors.append("Bad image %r in section %r: expected a filename, bytes or a function returning bytes, not %r"
+                              % (name, self.identifier, type(source)))
+        return errors
+
+    def getTableError(self, rows, tableName, tableIdentifier, columns):
+        if isinstance(rows, OpenDocMill.ColumnarTable):
+            missing = columns.difference(rows.columns)
+            if missing:
+                return "No value for field %r in table %r[row=0]" % (sorted(missing)[0], tableIdentifier)
+            return None
+        if isinstance(rows, dict):
+            return OpenDocMill.findColumnErrors(rows)
+        if not isinstance(rows, (list, tuple)):
+            if isinstance(rows, (str, bytes)) or not hasattr(rows, "__iter__"):
+                return "Expected list of row dicts: %r" % tableName
+            return None # checked as it is read
+        for i, row in enumerate(rows):
+            if not isinstance(row, dict):
+                return "Bad type for row %d of table %r: %r" % (i, tableIdentifier, type(row))
+            if not columns <= row.keys():
+                return "No value for field %r in table %r[row=%d]" % (sorted(columns.difference(row))[0], tableIdentifier, i)
+        return None
+
+def getSectionSchema(section):
+    return SectionSchema(section) if section is not None else None
+
+class TemplateSchema(object):
+    def __init__(self, template):
+        content = template.contentTemplate
+        styles = template.stylesTemplate
+        self.mainSection = None
+        self.sections = None
+        if isinstance(content, OpenDocMill.ReportContentTemplate):
+            self.mainSection = getSectionSchema(content.mainSection)
+        elif isinstance(content, OpenDocMill.BookContentTemplate):
+            self.sections = dict((name, SectionSchema(section)) for name, section in content.getSectionIndex().items())
+        self.headerSection = getSectionSchema(styles.headerSection) if styles is not None else None
+        self.footerSection = getSectionSchema(styles.footerSection) if styles is not None else None
+
+    def getErrors(self, data):
+        """Error strings for data; data of the wrong kind is left for the renderer to reject"""
+        errors = []
+        if isinstance(data, (list, tuple)):
+            try:
+                data = OpenDocMill.oldFormatToBookData(data)
+            except (TypeError, OpenDocMill.DataError):
+                return errors
+        if self.sections is not None and isinstance(data, OpenDocMill.BookData):
+            missing = set(name for name, _ in data.sections).difference(self.sections)
+            if missing:
+                errors.append("The following sections are in the data but not the template: %r" % tuple(sorted(missing)))
+            for i, (sectionName, sectionData) in enumerate(data.sections):
+                schema = self.sections.get(sectionName)
+                if schema is None: continue
+                errors.extend("section %i (%r): %s" % (i, sectionName, msg) for msg in schema.getErrors(sectionData))
+        elif self.mainSection is not None and isinstance(data, OpenDocMill.ReportData):
+            errors.extend(self.mainSection.getErrors(data.mainSection))
+        if isinstance(data, OpenDocMill.HeadFootData):
+            for schema, sectionData in ((self.headerSection, data.headerData), (self.footerSection, data.footerData)):
+                if schema is not None:
+                    errors.extend(schema.getErrors(sectionData))
+        return errors
+
+    def validate(self, data):
+        errors = self.getErrors(data)
+        if errors:
+            raise OpenDocMill.DataError("\n".join(errors))
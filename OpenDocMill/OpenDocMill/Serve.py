@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""Long-running document service: jobs in as JSON lines, one status line out per job.
+
+Each line of input is a JSON object
+
+    {"template": "invoiceTemplate.odt", "out": "outDoc.odt", "data": {...}}
+
+"data" being what runOpenDocMill.py reads on stdin (or, with "book": true,
+a list of dict(name='', fields={}, tables={}, images={}) sections).
+"template" may be left out if the service was given a default template.
+
+Compiled templates are kept in a TemplateRegistry, so each template is
+parsed once, and again only when its file changes.  With more than one
+worker, jobs run on a pool of processes, each with its own registry; the
+default template is compiled before the pool starts, so that forked workers
+share it.  The input line is only decoded in the worker.
+
+One line is written per job, in input order, as soon as the job and all
+those before it are done: "ok<TAB>outDoc.odt", or
+"error<TAB>outDoc.odt<TAB>message"; a line that cannot be read as a job
+gives "error<TAB>line N<TAB>message".  A client may send one job and wait
+for its status before sending the next.
+"""
+
+import concurrent.futures
+import json
+import threading
+import OpenDocMill
+import OpenDocMill.Batch
+import OpenDocMill.Registry
+
+class JobError(Exception): pass
+
+class Job(object):
+    def __init__(self, lineNo, template, out, data, book=False):
+        self.lineNo = lineNo
+        self.template = template
+        self.out = out
+        self.data = data
+        self.book = book
+
+def parseJob(line, lineNo, defaultTemplate=None, book=False):
+    try:
+        job = json.loads(line)
+    except ValueError as ex:
+        raise JobError(ex)
+    if not isinstance(job, dict):
+        raise JobError("Expected a JSON object, not %s" % type(job).__name__)
+    template = job.get("template", defaultTemplate)
+    if not isinstance(template, str):
+        raise JobError("No template" if template is None else "Bad template %r" % (template,))
+    out = job.get("out")
+    if not isinstance(out, str):
+        raise JobError("No out" if out is None else "Bad out %r" % (out,))
+    return Job(lineNo, template, out, job.get("data", {}), bool(job.get("book", book)))
+
+def makeReportData(raw_data, headFoot=False):
+    """ReportData from what runOpenDocMill.py reads: a dict of fields, tables
+    and images, or a list whose first item is one.  With headFoot, the header
+    and footer get the same data, as in runOpenDocMillReport.py"""
+    if isinstance(raw_data, list):
+        raw_data = raw_data[0] if raw_data and isinstance(raw_data[0], dict) else {}
+    if not isinstance(raw_data, dict):
+        return OpenDocMill.ReportData()
+    fields = raw_data.get('fields', {})
+    tables = raw_data.get('tables', {})
+    images = raw_data.get('images', {})
+    reportData = OpenDocMill.ReportData(fields=fields, tables=tables, images=images)
+    if headFoot:
+        reportData.setHeaderData(fields=fields, tables=tables, images=images)
+        reportData.setFooterData(fields=fields, tables=tables, images=images)
+    return reportData
+
+def oneLine(error):
+    return " ".join(str(error).split())
+
+#### Workers ###############################################################################################
+
+workerRegistry = None
+
+def initWorker(maxTemplates, cacheDir):
+    global workerRegistry
+    # a forked worker inherits the registry serve filled before starting the pool
+    if workerRegistry is None:
+        workerRegistry = OpenDocMill.Registry.TemplateRegistry(maxTemplates=maxTemplates, cacheDir=cacheDir)
+
+def writeJob(registry, job, headFoot):
+    if job.book:
+        template = registry.getBook(job.template)
+        data = job.data
+    else:
+        template = registry.getReport(job.template)
+        data = makeReportData(job.data, headFoot)
+    template.write(job.out, data)
+
+def runJob(line, lineNo, defaultTemplate, book, headFoot):
+    """In a worker process: returns what to report the job as, and None or the
+    error message (rather than the exception, which may not pickle)"""
+    try:
+        job = parseJob(line, lineNo, defaultTemplate, book)
+    except JobError as ex:
+        return "line %d" % lineNo, str(ex)
+    try:
+        writeJob(workerRegistry, job, headFoot)
+    except Exception as ex:
+        return job.out, str(ex)
+    return job.out, None
+
+#### Status ################################################################################################
+
+class StatusWriter(object):
+    """Writes status lines in job order, from whichever thread finishes a job"""
+
+    def __init__(self, write):
+        self.write = write
+        self.lock = threading.Lock()
+        self.next = 0
+        self.done = {} # job number: status line
+        self.failed = 0
+
+    def add(self, n, out, error=None):
+        if error is None:
+            line = "ok\t%s\n" % out
+        else:
+            line = "error\t%s\t%s\n" % (out, oneLine(error))
+        with self.lock:
+            if error is not None: self.failed += 1
+            self.done[n] = line
+            while self.next in self.done:
+                self.write(self.done.pop(self.next))
+                self.next += 1
+
+def serve(lines, write, workers=1, defaultTemplate=None, book=False, headFoot=False,
+          maxTemplates=32, cacheDir=None, maxPending=None):
+    """Runs a job for each line of lines, writing its status with write(text);
+    returns the number of jobs that failed"""
+    status = StatusWriter(write)
+    numbered = ((lineNo, line) for lineNo, line in enumerate(lines, 1) if line.strip())
+    jobLines = ((n, lineNo, line) for n, (lineNo, line) in enumerate(numbered))
+
+    if workers is None or workers <= 1:
+        registry = OpenDocMill.Registry.TemplateRegistry(maxTemplates=maxTemplates, cacheDir=cacheDir)
+        for n, lineNo, line in jobLines:
+            try:
+                job = parseJob(line, lineNo, defaultTemplate, book)
+            except JobError as ex:
+                status.add(n, "line %d" % lineNo, ex)
+                continue
+            try:
+                writeJob(registry, job, headFoot)
+            except Exception as ex:
+                status.add(n, job.out, ex)
+            else:
+                status.add(n, job.out)
+        return status.failed
+
+    if maxPending is None:
+        maxPending = workers * 4
+    # taken for each job submitted, given back when it is done; input is read
+    # only while fewer than maxPending jobs are running
+    slots = threading.BoundedSemaphore(maxPending)
+
+    global workerRegistry
+    workerRegistry = OpenDocMill.Registry.TemplateRegistry(maxTemplates=maxTemplates, cacheDir=cacheDir)
+    if defaultTemplate is not None:
+        # compiled (and prepared) once here, so forked workers share it
+        try:
+            workerRegistry.get(defaultTemplate, "book" if book else "report")
+        except Exception:
+            pass # each job using it reports the error
+
+    def finished(n, lineNo, future):
+        try:
+            out, error = future.result()
+        except Exception as ex:
+            # the worker died (or the pool was shut down) before answering
+            out, error = "line %d" % lineNo, ex
+        try:
+            status.add(n, out, error)
+        finally:
+            slots.release()
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(workers, mp_context=OpenDocMill.Batch.getContext(),
+                                                    initializer=initWorker, initargs=(maxTemplates, cacheDir)) as executor:
+            for n, lineNo, line in jobLines:
+                slots.acquire()
+                future = executor.submit(runJob, line, lineNo, defaultTemplate, book, headFoot)
+                future.add_done_callback(lambda f, n=n, lineNo=lineNo: finished(n, lineNo, f))
+    finally:
+        workerRegistry = None
+    return status.failed
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+"""Streaming template compiler built on xml.parsers.expat.
+
+Produces the same Section/Table/Row structures as the minidom visitors in
+OpenDocMill.Reader, in one pass and without building a DOM.  The visitors
+below reuse the DOM visitors' logic for variables, attributes and section
+detection; only the element walk is replaced by expat start/end events, so
+there is no recursion however deeply the template is nested.
+
+Whether a table repeats its last row is only known once the table has been
+seen completely, so the events of each top-level table are buffered until
+its end tag, analysed, and then replayed.  Memory is therefore bounded by
+the largest table rather than by the whole document.
+"""
+
+import xml.parsers.expat
+import OpenDocMill
+from OpenDocMill.Reader import (TEXT, DRAW, TABLE, XLINK, XMLNS,
+    ODTBookContentVisitor, ODTReportContentVisitor, ODTStyleVisitor)
+
+class Attr(object):
+    __slots__ = ("name", "namespaceURI", "localName", "prefix", "value")
+
+    def __init__(self, namespaceURI, localName, prefix, value):
+        self.name = prefix + ":" + localName if prefix else localName
+        self.namespaceURI = namespaceURI
+        self.localName = localName
+        self.prefix = prefix
+        self.value = value
+
+class Element(object):
+    """Just enough of the minidom element interface for the visitors"""
+    __slots__ = ("namespaceURI", "localName", "prefix", "tagName", "attributes", "parentNode",
+                 "hasChildren", "isRepeatTable", "isRepeatRow", "handler", "savedWrite", "textParts")
+
+    def __init__(self, namespaceURI, localName, prefix, attributes, parentNode):
+        self.namespaceURI = namespaceURI
+        self.localName = localName
+        self.prefix = prefix
+        self.tagName = prefix + ":" + localName if prefix else localName
+        self.attributes = attributes
+        self.parentNode = parentNode
+        self.hasChildren = False
+        self.isRepeatTable = False
+        self.isRepeatRow = False
+        self.handler = None
+        self.savedWrite = None
+        self.textParts = None
+
+    def getAttributeNS(self, namespaceURI, localName):
+        for attr in self.attributes:
+            if attr.localName == localName and attr.namespaceURI == namespaceURI:
+                return attr.value
+        return ""
+
+def splitName(name):
+    """expat reports "uri local prefix" with namespace_prefixes set"""
+    parts = name.split(" ")
+    if len(parts) == 3: return parts[0], parts[1], parts[2]
+    if len(parts) == 2: return parts[0], parts[1], None
+    return None, name, None
+
+START, END, CHARS = OpenDocMill.Reader.START, OpenDocMill.Reader.END, 2
+
+def markRepeatTables(events):
+    for t, lastRow in OpenDocMill.Reader.findRepeatTables(events):
+        t.isRepeatTable = True
+        lastRow.isRepeatRow = True
+
+class StreamCompiler(object):
+    """Feeds expat events to a streaming visitor, buffering table subtrees"""
+    def __init__(self, visitor, bufferSize=1 << 16):
+        self.visitor = visitor
+        self.bufferSize = bufferSize
+        self.current = None
+        self.pendingNss = []
+        self.events = None # list while inside a top-level table
+        self.tableDepth = 0
+
+    def parse(self, xmlStream):
+        parser = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+        parser.namespace_prefixes = True
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.buffer_size = self.bufferSize
+        parser.StartNamespaceDeclHandler = self.startNamespaceDecl
+        parser.StartElementHandler = self.startElement
+        parser.EndElementHandler = self.endElement
+        parser.CharacterDataHandler = self.characters
+        self.visitor.startDocument()
+        if isinstance(xmlStream, (bytes, str)):
+            parser.Parse(xmlStream, True)
+        else:
+            parser.ParseFile(xmlStream)
+
+    def startNamespaceDecl(self, prefix, uri):
+        self.pendingNss.append((prefix, uri or ""))
+        self.visitor.nsHints[prefix] = uri
+
+    def startElement(self, name, attrList):
+        # namespace declarations come first, as minidom orders them
+        attributes = []
+        for prefix, uri in self.pendingNss:
+            if prefix: attributes.append(Attr(XMLNS, prefix, "xmlns", uri))
+            else: attributes.append(Attr(XMLNS, "xmlns", None, uri))
+        self.pendingNss = []
+        for i in range(0, len(attrList), 2):
+            ns, local, prefix = splitName(attrList[i])
+            attributes.append(Attr(ns, local, prefix, attrList[i + 1]))
+        ns, local, prefix = splitName(name)
+        node = Element(ns, local, prefix, attributes, self.current)
+        self.current = node
+
+        if ns == TABLE and local == "table":
+            if self.events is None: self.events = []
+            self.tableDepth += 1
+        if self.events is not None:
+            self.events.append((START, node))
+        else:
+            self.visitor.startElement(node)
+
+    def endElement(self, name):
+        node = self.current
+        self.current = node.parentNode
+        if self.events is None:
+            self.visitor.endElement(node)
+            return
+        self.events.append((END, node))
+        if node.namespaceURI == TABLE and node.localName == "table":
+            self.tableDepth -= 1
+            if self.tableDepth == 0:
+                events, self.events = self.events, None
+                markRepeatTables(events)
+                self.replay(events)
+
+    def characters(self, data):
+        if self.current is None: return
+        if self.events is not None:
+            self.events.append((CHARS, data))
+        else:
+            self.visitor.characters(data)
+
+    def replay(self, events):
+        visitor = self.visitor
+        for kind, x in events:
+            if kind == START: visitor.startElement(x)
+            elif kind == END: visitor.endElement(x)
+            else: visitor.characters(x)
+
+class StreamVisitorMixin(object):
+    """Event-driven counterpart of ODTVisitor.visitElement and friends.
+
+    Each element's start tag, ">" and end tag are written to whichever
+    stream is current at that moment, exactly as the recursive printer does;
+    since whether an element has children is only known later, the ">" is
+    written on the first child event and "/>" on an empty end."""
+
+    def __init__(self, template, nsHints=None):
+        super().__init__(template, {}, {}, {} if nsHints is None else nsHints)
+        self.skipDepth = 0
+        self.currentNode = None
+
+    def startDocument(self):
+        self.visitProlog()
+
+    def startTag(self, node):
+        self.write("<" + node.tagName)
+        for attr in node.attributes:
+            self.visitAttr(attr)
+
+    def endTag(self, node):
+        if node.hasChildren:
+            self.write("</" + node.tagName + ">")
+        else:
+            self.write("/>")
+
+    def startChild(self, parent):
+        if parent is not None and not parent.hasChildren:
+            parent.hasChildren = True
+            self.write(">")
+
+    def startElement(self, node):
+        self.currentNode = node
+        if self.skipDepth:
+            self.skipDepth += 1
+            return
+        self.startChild(node.parentNode)
+        if self.isSectionNode(node):
+            node.handler = self.endSection
+            self.startSection(node)
+        elif node.namespaceURI == TEXT and node.localName == "variable-set":
+            # neither the element nor its children are printed
+            self.visitVariableSet(node)
+            self.skipDepth = 1
+        elif node.namespaceURI == TABLE and node.localName == "table" and node.isRepeatTable:
+            node.handler = self.endTable
+            self.startTable(node)
+        elif node.namespaceURI == TABLE and node.localName == "table-row" and node.isRepeatRow:
+            node.handler = self.endLastRow
+            self.startLastRow(node)
+        elif node.namespaceURI == DRAW and node.localName == "image":
+            node.handler = self.endImage
+            self.startImage(node)
+        else:
+            self.startTag(node)
+
+    def endElement(self, node):
+        self.currentNode = node.parentNode
+        if self.skipDepth:
+            self.skipDepth -= 1
+            return
+        self.endTag(node)
+        if node.handler is not None:
+            node.handler(node)
+
+    def characters(self, data):
+        if self.skipDepth: return
+        parent = self.currentNode
+        self.startChild(parent)
+        if parent.textParts is not None:
+            parent.textParts.append(data)
+        self.write(data)
+
+    def startSection(self, node):
+        self.addSection(node)
+        self.fakeStream.write = self.section.addText
+        self.writeState = "SECTION"
+        self.sectionParent = node.parentNode
+        self.startTag(node)
+
+    def endSection(self, node):
+        pass
+
+    def startTable(self, node):
+        if self.writeState != "SECTION" and self.section is not None:
+            self.writeState = "SECTION"
+        if self.writeState != "SECTION":
+            raise OpenDocMill.TemplateError(f"Found table but not in section state (state={self.writeState})")
+        node.savedWrite = self.fakeStream.write
+        self.writeState = "TABLE"
+        self.tableName = node.getAttributeNS(TABLE, "name")
+        self.table = OpenDocMill.Table(self.section.identifier + "/" + self.tableName)
+        self.section.addTable(self.tableName, self.table)
+        self.fakeStream.write = self.table.addBeforeText
+        self.startTag(node)
+
+    def endTable(self, node):
+        self.fakeStream.write = node.savedWrite
+        self.writeState = "SECTION"
+        self.tableName = None
+        self.table = None
+
+    def startLastRow(self, node):
+        if self.table is None:
+            parent = node.parentNode
+            if parent:
+                self.tableName = parent.getAttributeNS(TABLE, "name")
+                self.table = OpenDocMill.Table(self.section.identifier + "/" + self.tableName)
+                self.section.addTable(self.tableName, self.table)
+                self.writeState = "TABLE"
+        if self.writeState != "TABLE":
+            raise OpenDocMill.TemplateError(f"Found table row but not in table state (state={self.writeState})")
+        self.row = OpenDocMill.Row(self.table.identifier)
+        self.table.setRow(self.row)
+        self.fakeStream.write = self.row.addText
+        self.writeState = "ROW"
+        self.startTag(node)
+
+    def endLastRow(self, node):
+        self.writeState = "TABLE"
+        self.fakeStream.write = self.table.addAfterText
+        self.row = None
+
+    def startImage(self, node):
+        assert self.writeState == "SECTION"
+        assert node.parentNode.namespaceURI == DRAW and node.parentNode.localName == "frame"
+        self.imageName = node.parentNode.getAttributeNS(DRAW, "name")
+        self.defaultFilename = node.getAttributeNS(XLINK, "href")
+        self.writeState = "IMAGE"
+        self.startTag(node)
+
+    def endImage(self, node):
+        self.writeState = "SECTION"
+        self.imageName = None
+        self.defaultFilename = None
+
+class StreamBookContentVisitor(StreamVisitorMixin, ODTBookContentVisitor):
+    def addSection(self, node):
+        # The section is named after the heading's text, which has not been
+        # read yet; it is registered when the heading ends.
+        self.section = OpenDocMill.Section(None)
+        node.textParts = []
+
+    def endSection(self, node):
+        sectionName = ''.join(node.textParts)
+        node.textParts = None
+        self.section.identifier = OpenDocMill.internName(self.template.identifier + "#" + sectionName)
+        self.template.addSection(sectionName, self.section)
+
+class StreamReportContentVisitor(StreamVisitorMixin, ODTReportContentVisitor):
+    pass
+
+class StreamStyleVisitor(StreamVisitorMixin, ODTStyleVisitor):
+    pass
+
+def streamXML(xmlStream, fileIdentifier, VisitorClass, TemplateClass, appendImage):
+    template = TemplateClass(str(fileIdentifier), appendImage)
+    StreamCompiler(VisitorClass(template)).parse(xmlStream)
+    return template
@@ -34,48 +34,59 @@ def getVariableDecls(doc):
         return nodes[0]
 
 def create(inTemplateTemplate, outTemplate, fields, tables):
+    def editContent(doc):
+        decls = getVariableDecls(doc)
+        appendFields(doc, fields, decls)
+        for tableName, tableFields in tables.items():
+            appendTable(doc, tableName, tableFields, decls)
+    rewrite(inTemplateTemplate, outTemplate, editContent)
+
+def rewrite(inTemplateTemplate, outTemplate, editContent, editStyles=None):
+    """Copies inTemplateTemplate to outTemplate, passing the DOM of its content.xml
+    to editContent(doc), and that of its styles.xml to editStyles(doc) if given"""
     inZipFile = zipfile.ZipFile(inTemplateTemplate, 'r')
-    inContent = inZipFile.read("content.xml")
-    doc = xml.dom.minidom.parseString(inContent)
+    edits = {"content.xml": editContent}
+    if editStyles is not None:
+        edits["styles.xml"] = editStyles
 
-    decls = getVariableDecls(doc)
-    appendFields(doc, fields, decls)
-    for tableName, tableFields in tables.items():
-        appendTable(doc, tableName, tableFields, decls)
-
-    outContent = doc.toxml().encode('UTF-8')
     outZipFile = zipfile.ZipFile(outTemplate, "w")
     for fileInfo in inZipFile.filelist:
-        if fileInfo.filename == "content.xml":
-            outZipFile.writestr(fileInfo, outContent)
+        if fileInfo.filename in edits:
+            doc = xml.dom.minidom.parseString(inZipFile.read(fileInfo.filename))
+            edits[fileInfo.filename](doc)
+            outZipFile.writestr(fileInfo, doc.toxml().encode('UTF-8'))
         else:
             outZipFile.writestr(fileInfo, inZipFile.read(fileInfo.filename))
     inZipFile.close()
     outZipFile.close()
 
-def appendFields(doc, fields, decls):
-    officeText = getOneByTagName(doc, OFFICE, "text")
+def createField(doc, varName, text):
+    """A paragraph holding text and the variable varName (a str)"""
+    if isinstance(text, bytes): text = text.decode('UTF-8')
+    # in minidom, the *NS functions do not work when creating content    
+    p = doc.createElement("text:p")
+    p.setAttribute("text:style-name", "Standard")
+    p.appendChild(doc.createTextNode(text + ": "))
+    v = doc.createElement("text:variable-set")
+    v.setAttribute("text:name", varName)
+    v.setAttribute("office:value-type", "string")
+    v.appendChild(doc.createTextNode(varName))
+    p.appendChild(v)
+    return p
+
+def appendFields(doc, fields, decls, officeText=None):
+    if officeText is None: officeText = getOneByTagName(doc, OFFICE, "text")
     for varName, text in fields.items():
-        if isinstance(varName, str): varName = varName.decode('UTF-8')
-        if isinstance(text, str): text = text.decode('UTF-8')
-        # in minidom, the *NS functions do not work when creating content    
-        p = doc.createElement("text:p")
-        p.setAttribute("text:style-name", "Standard")
-        p.appendChild(doc.createTextNode(text + ": "))
-        v = doc.createElement("text:variable-set")
-        v.setAttribute("text:name", varName)
-        v.setAttribute("office:value-type", "string")
-        v.appendChild(doc.createTextNode(varName))
-        p.appendChild(v)
-        officeText.appendChild(p)
+        if isinstance(varName, bytes): varName = varName.decode('UTF-8')
+        officeText.appendChild(createField(doc, varName, text))
         decl = doc.createElement("text:variable-decl")
         decl.setAttribute("office:value-type", "string")
         decl.setAttribute("text:name", varName)
         decls.appendChild(decl)
 
-def appendTable(doc, tableName, tableFields, decls):
-    if isinstance(tableName, str): tableName = tableName.decode('UTF-8')
-    officeText = getOneByTagName(doc, OFFICE, "text")
+def appendTable(doc, tableName, tableFields, decls, officeText=None):
+    if isinstance(tableName, bytes): tableName = tableName.decode('UTF-8')
+    if officeText is None: officeText = getOneByTagName(doc, OFFICE, "text")
 
     # in minidom, the *NS functions do not work when creating content    
     nameP = doc.createElement("text:p")
@@ -96,8 +107,8 @@ def appendTable(doc, tableName, tableFields, decls):
     table.appendChild(valRow)
     for fieldName, fieldText in tableFields:
         fullName = tableName + u"." + fieldName
-        if isinstance(fieldName, str): fieldName = fieldName.decode('UTF-8')
-        if isinstance(fieldText, str): fieldText = fieldText.decode('UTF-8')
+        if isinstance(fieldName, bytes): fieldName = fieldName.decode('UTF-8')
+        if isinstance(fieldText, bytes): fieldText = fieldText.decode('UTF-8')
         nameCell = doc.createElement("table:table-cell")
         nameCell.setAttribute("office:value-type", "string")
         nameP = doc.createElement("text:p")
@@ -123,11 +134,11 @@ if __name__ == '__main__':
     try:
         inFile, outFile = sys.argv[1:3]
     except ValueError:
-        print >> sys.stderr, "Usage: %s inFile.odt outFile.out"
+        print("Usage: %s inFile.odt outFile.out" % sys.argv[0], file=sys.stderr)
         sys.exit(1)
 
-    fields = [("field1", "name1"), ("field2", "name2")]
-    tables = [
+    fields = dict([("field1", "name1"), ("field2", "name2")])
+    tables = dict([
         ("tbl1", [
             ("field1", "tname1"),
             ("field2", "tname2"),
@@ -138,5 +149,5 @@ if __name__ == '__main__':
             ("field2", "tname2"),
             ("field3", "tname3"),
         ]),
-    ]
+    ])
     create(inFile, outFile, fields, tables)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""Copies zip members without decompressing and recompressing them.
+
+zipfile can only add a member from its uncompressed bytes, so copying an
+untouched member of the template (pictures, thumbnails, settings.xml, ...)
+with writestr(fileInfo, read(...)) inflates and deflates it again for every
+document.  readRawMember reads a member's compressed bytes as stored in the
+archive, and writeRawMember adds them to another archive with the original
+CRC and sizes, the way ZipFile.writestr would lay them out.  The latter has
+to use ZipFile's internals (its file object, lock and central directory
+lists).  All such use goes through the functions under "zipfile internals"
+below.  Where internalsSupported says this Python's zipfile lacks what they
+need, callers fall back to zipfile's own writestr and open; the functions
+themselves raise ZipInternalsError rather than write a corrupt archive.
+
+A CompressionPolicy chooses the compression of each member of the output,
+trading CPU for size; see COMPRESSION_POLICIES.
+
+ParallelDeflateWriter deflates a large member pigz style: the data is cut
+into blocks, each block is deflated on a thread pool (zlib releases the
+GIL) with the 32K of data before it as its dictionary and ends on a byte
+boundary with a sync flush, and the blocks are joined in order and closed
+with an empty final block, which makes one valid deflate stream.
+"""
+
+import collections
+import concurrent.futures
+import copy
+import fnmatch
+import struct
+import sys
+import zipfile
+import zlib
+
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+#### zipfile internals #####################################################################################
+
+class ZipInternalsError(RuntimeError): pass
+
+### zipfile releases these were written against; outside them, or if an attribute has gone,
+### the public (slower) interface is used instead
+ZIPFILE_VERSIONS = ((3, 7), (3, 14))
+ZIPFILE_ATTRIBUTES = ("fp", "filelist", "NameToInfo", "start_dir", "_lock", "_writing", "_writecheck", "_didModify", "_seekable")
+ZIPFILE_FUNCTIONS = ("_strip_extra",)
+
+def findMissingInternals(zipFile):
+    """Why zipFile's internals cannot be used here, or None if they can"""
+    version = sys.version_info[:2]
+    if not ZIPFILE_VERSIONS[0] <= version <= ZIPFILE_VERSIONS[1]:
+        return "not checked against Python %d.%d (only %d.%d to %d.%d)" % (version + ZIPFILE_VERSIONS[0] + ZIPFILE_VERSIONS[1])
+    missing = [name for name in ZIPFILE_ATTRIBUTES if not hasattr(zipFile, name)]
+    missing += ["zipfile." + name for name in ZIPFILE_FUNCTIONS if not hasattr(zipfile, name)]
+    if missing:
+        return "missing from Python %d.%d: %s" % (version + (", ".join(missing),))
+    return None
+
+supportedTypes = {} # ZipFile class: whether its internals can be used
+
+def internalsSupported(zipFile):
+    """Whether the functions below can be used on zipFile; checked once per ZipFile class"""
+    supported = supportedTypes.get(type(zipFile))
+    if supported is None:
+        supported = supportedTypes[type(zipFile)] = findMissingInternals(zipFile) is None
+    return supported
+
+def checkInternals(zipFile):
+    """Raises ZipInternalsError unless zipFile has the private attributes used here"""
+    if not internalsSupported(zipFile):
+        raise ZipInternalsError("OpenDocMill.Zip uses zipfile internals %s" % findMissingInternals(zipFile))
+
+### ZipInfo's compression level, public as compress_level from Python 3.13
+COMPRESS_LEVEL = "compress_level" if hasattr(zipfile.ZipInfo(), "compress_level") else "_compresslevel"
+
+def getCompressLevel(zinfo):
+    if not hasattr(zinfo, COMPRESS_LEVEL):
+        raise ZipInternalsError("OpenDocMill.Zip uses ZipInfo.%s, missing from Python %d.%d" % ((COMPRESS_LEVEL,) + sys.version_info[:2]))
+    return getattr(zinfo, COMPRESS_LEVEL)
+
+def setCompressLevel(zinfo, compressLevel):
+    getCompressLevel(zinfo)
+    setattr(zinfo, COMPRESS_LEVEL, compressLevel)
+
+def lockArchive(zipFile):
+    """The lock to hold while using zipFile's file object"""
+    checkInternals(zipFile)
+    return zipFile._lock
+
+def isSeekable(zipFile):
+    checkInternals(zipFile)
+    return zipFile._seekable
+
+def startMember(zipFile, zinfo, zip64=False, streaming=False):
+    """Writes zinfo's local header at the end of zipFile (open for writing),
+    as ZipFile.open(..., "w") does; with streaming, zipFile is left busy
+    until finishMember, as it is while that handle is open"""
+    with lockArchive(zipFile):
+        if zipFile._writing:
+            raise ValueError("Can't write to the ZIP file while there is an open writing handle on it")
+        zinfo.extra = zipfile._strip_extra(zinfo.extra, (1,)) # zip64 sizes are written afresh
+        zipFile._writecheck(zinfo)
+        zipFile._didModify = True
+        if zipFile._seekable:
+            zipFile.fp.seek(zipFile.start_dir)
+        zinfo.header_offset = zipFile.fp.tell()
+        zipFile.fp.write(zinfo.FileHeader(zip64))
+        if streaming:
+            zipFile._writing = True
+
+def finishMember(zipFile, zinfo=None):
+    """Adds zinfo, whose data ends where zipFile's file object is, to the central
+    directory; with None, only frees zipFile for the next member"""
+    with lockArchive(zipFile):
+        try:
+            if zinfo is not None:
+                zipFile.start_dir = zipFile.fp.tell()
+                zipFile.filelist.append(zinfo)
+                zipFile.NameToInfo[zinfo.filename] = zinfo
+        finally:
+            zipFile._writing = False
+
+#### Raw members ############################################################################################
+
+def readRawMember(zipFile, zipInfo):
+    """Returns the compressed bytes of zipInfo's member of zipFile (open for reading)"""
+    with lockArchive(zipFile):
+        f = zipFile.fp
+        f.seek(zipInfo.header_offset)
+        header = f.read(LOCAL_HEADER.size)
+        fields = LOCAL_HEADER.unpack(header) if len(header) == LOCAL_HEADER.size else None
+        if fields is None or fields[0] != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile("Bad local file header for %r in %r" % (zipInfo.filename, zipFile.filename))
+        nameLength, extraLength = fields[-2], fields[-1]
+        f.seek(nameLength + extraLength, 1)
+        data = f.read(zipInfo.compress_size)
+    if len(data) != zipInfo.compress_size:
+        raise zipfile.BadZipFile("Truncated member %r in %r" % (zipInfo.filename, zipFile.filename))
+    return data
+
+def canCopyRaw(zipInfo):
+    # encrypted members are left to zipfile
+    return not zipInfo.flag_bits & 0x1
+
+def writeRawMember(zipFile, zipInfo, data):
+    """Adds a member to zipFile (open for writing) from its compressed bytes;
+    zipInfo gives the name, compression, CRC and sizes"""
+    zinfo = copy.copy(zipInfo)
+    zinfo.compress_size = len(data)
+    # CRC and sizes are known, so they go in the local header rather than
+    # in a data descriptor after the data
+    zinfo.flag_bits &= ~0x08
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+    with lockArchive(zipFile):
+        startMember(zipFile, zinfo, zip64)
+        zipFile.fp.write(data)
+        finishMember(zipFile, zinfo)
+
+STORED, DEFLATED = zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED
+
+class CompressionPolicy(object):
+    """Compression for each member of a written document.
+
+    rules are (pattern, compressType, compressLevel), matched in order against
+    member names with fnmatch; a level of None is zlib's default.  Members that
+    no rule matches, or whose rule's compressType is None, keep the template's
+    compression, as do the mimetype member, which ODF requires to be stored,
+    and directories."""
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    def getCompression(self, filename):
+        """Returns (compressType, compressLevel), or None to keep the template's"""
+        if filename == "mimetype" or filename.endswith("/"):
+            return None
+        for pattern, compressType, compressLevel in self.rules:
+            if fnmatch.fnmatchcase(filename, pattern):
+                if compressType is None: return None
+                return compressType, compressLevel
+        return None
+
+    def __repr__(self):
+        return "CompressionPolicy(%r)" % (self.rules,)
+
+### PNG and JPEG are compressed already; deflating them again costs time for next to nothing
+PICTURES = ["Pictures/*.png", "Pictures/*.jpg", "Pictures/*.jpeg", "Thumbnails/*.png"]
+
+COMPRESSION_POLICIES = {
+    "template": CompressionPolicy(), # as the template's members, pictures added by write are stored
+    "fast": CompressionPolicy([(p, STORED, None) for p in PICTURES] + [("*", DEFLATED, 1)]),
+    "archival": CompressionPolicy([(p, None, None) for p in PICTURES] + [("*", DEFLATED, 9)]),
+    "stored": CompressionPolicy([("*", STORED, None)]),
+}
+
+def getCompressionPolicy(policy):
+    """policy is a CompressionPolicy, a name in COMPRESSION_POLICIES, or None for the template's compression"""
+    if policy is None:
+        return COMPRESSION_POLICIES["template"]
+    if isinstance(policy, CompressionPolicy):
+        return policy
+    if policy not in COMPRESSION_POLICIES:
+        raise ValueError("Unknown compression policy %r, expected one of %r" % (policy, tuple(sorted(COMPRESSION_POLICIES))))
+    return COMPRESSION_POLICIES[policy]
+
+def applyCompression(zipInfo, compression):
+    """Copy of zipInfo with compression, a (compressType, compressLevel) from
+    getCompression; zipInfo itself if compression is None"""
+    if compression is None:
+        return zipInfo
+    zinfo = copy.copy(zipInfo)
+    zinfo.compress_type = compression[0]
+    setCompressLevel(zinfo, compression[1])
+    return zinfo
+
+def canCompressRaw(compression):
+    return compression is None or compression[0] in (STORED, DEFLATED)
+
+def compressRaw(data, compressType, compressLevel):
+    """Compressed bytes of data as zipfile would store them"""
+    if compressType == STORED:
+        return data
+    if compressLevel is None:
+        compressLevel = zlib.Z_DEFAULT_COMPRESSION
+    compressor = zlib.compressobj(compressLevel, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+class RawMemberWriter(object):
+    """Adds a member to zipFile from compressed bytes written as they come;
+    the CRC and sizes are filled in by close, as ZipFile.open(..., "w") does"""
+    def __init__(self, zipFile, zipInfo):
+        self.zipFile = zipFile
+        self.zinfo = copy.copy(zipInfo)
+        self.zinfo.compress_size = self.zinfo.file_size = self.zinfo.CRC = 0
+        if isSeekable(zipFile):
+            self.zinfo.flag_bits &= ~0x08
+        else:
+            self.zinfo.flag_bits |= 0x08 # CRC and sizes follow the data
+        startMember(zipFile, self.zinfo, streaming=True)
+
+    def write(self, data):
+        self.zinfo.compress_size += len(data)
+        self.zipFile.fp.write(data)
+
+    def close(self, crc, fileSize):
+        zipFile = self.zipFile
+        zinfo = self.zinfo
+        zinfo.CRC = crc
+        zinfo.file_size = fileSize
+        try:
+            if zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT:
+                raise RuntimeError("File size too large for %r" % zinfo.filename)
+            if zinfo.flag_bits & 0x08:
+                zipFile.fp.write(struct.pack("<LLLL", 0x08074b50, zinfo.CRC, zinfo.compress_size, zinfo.file_size))
+            else:
+                end = zipFile.fp.tell()
+                zipFile.fp.seek(zinfo.header_offset)
+                zipFile.fp.write(zinfo.FileHeader(False))
+                zipFile.fp.seek(end)
+        except BaseException:
+            finishMember(zipFile)
+            raise
+        finishMember(zipFile, zinfo)
+
+DEFLATE_WINDOW = 1 << 15
+FINAL_BLOCK = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15).flush() # an empty last block
+
+def deflateBlock(block, dictionary, compressLevel):
+    if dictionary:
+        compressor = zlib.compressobj(compressLevel, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(compressLevel, zlib.DEFLATED, -15)
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+class ParallelDeflateWriter(object):
+    """Binary stream deflating a member of zipFile on workers threads"""
+    def __init__(self, zipFile, zipInfo, workers, blockSize=1 << 17):
+        self.entry = RawMemberWriter(zipFile, zipInfo)
+        self.compressLevel = getCompressLevel(zipInfo)
+        if self.compressLevel is None:
+            self.compressLevel = zlib.Z_DEFAULT_COMPRESSION
+        self.blockSize = blockSize
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.maxPending = 2 * workers
+        self.pending = collections.deque()
+        self.parts = []
+        self.size = 0
+        self.dictionary = b""
+        self.crc = 0
+        self.fileSize = 0
+        self.blocks = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= self.blockSize:
+            # one task per block, however much comes in one write
+            data = b"".join(self.parts)
+            end = len(data) - len(data) % self.blockSize
+            for start in range(0, end, self.blockSize):
+                self.submit(data[start:start + self.blockSize])
+            self.parts = [data[end:]] if end < len(data) else []
+            self.size = len(data) - end
+
+    def submit(self, block):
+        self.blocks += 1
+        self.crc = zlib.crc32(block, self.crc)
+        self.fileSize += len(block)
+        self.pending.append(self.executor.submit(deflateBlock, block, self.dictionary, self.compressLevel))
+        self.dictionary = block[-DEFLATE_WINDOW:]
+        while len(self.pending) > self.maxPending:
+            self.entry.write(self.pending.popleft().result())
+
+    def close(self):
+        try:
+            if self.parts:
+                self.submit(b"".join(self.parts))
+            while self.pending:
+                self.entry.write(self.pending.popleft().result())
+            self.entry.write(FINAL_BLOCK)
+            self.entry.close(self.crc, self.fileSize)
+        finally:
+            self.executor.shutdown()
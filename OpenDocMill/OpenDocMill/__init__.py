@@ -2,7 +2,10 @@
 
 import zipfile
 import io
-import os.path
+import sys
+import time
+import concurrent.futures
+import itertools
 import re
 import xml.dom.minidom
 
@@ -10,27 +13,169 @@ import xml.dom.minidom
 #### Set up new conversion object with "[reportObject] = OpenDocMill.Reader.readReportODT(template)".
 #### "template" being the odt template file name.
 ####
+#### To skip the XML parse in later processes, pass "cacheDir=[directory]" to readReportODT/readBookODT;
+#### the compiled template is stored there, keyed by the template's content hash and the library version.
+#### Long-lived processes can use "OpenDocMill.Registry.TemplateRegistry().getReport(template)" instead,
+#### which keeps compiled templates in memory and reloads them when the file changes.
+####
 #### Convert new file using "[reportObject].write(out, data)".
-#### "out" being the new file name.
+#### "out" being the new file name, or a writable binary file object (which need not be seekable).
+#### "[reportObject].writeBytes(data)" returns the new file as bytes instead.
+#### The template can also be given as bytes or a binary file object rather than a file name.
 #### "data" needs to be an object like "OpenDocMill.ReportData(fields=fields, tables=tables, images=images).
 ####
 #### All three data input variables are hashes, mapping template variable names to their real values.
-#### Images should be submitted as file names.
+#### Images should be submitted as file names, as bytes, or as functions returning the bytes; each picture
+#### is stored once per document, named by its content hash, and image files are read once and cached
+#### (see OpenDocMill.Images).
 #### The "tables" data input is a hash of table-names, each table name is assigned an array for every new line
 #### of data in the table.
+#### Instead of an array, any iterable of rows (a generator, DB cursor, csv.DictReader) can be given;
+#### its rows are then checked and rendered one at a time, and it can only be rendered once.
 #### Each table array entry is a hash of table row variables.
+#### "OpenDocMill.setValidation('strict')" checks the data against what the template uses before anything is
+#### written, reporting every problem at once; "OpenDocMill.setValidation('off')" skips all checks.
+#### A table can also be given by column, as a hash (or OpenDocMill.ColumnarTable) of row variable names to
+#### equal-length lists or NumPy arrays; each column is then formatted and escaped in one go.
+####
+#### To produce many documents from one template, use "[reportObject].writeMany(jobs, workers)" with an
+#### iterable of (out, data) pairs; the template is compiled once and shared by a pool of worker processes.
+#### It yields (out, error) for every job, in order, error being None or the exception the job raised.
+####
+#### "compression" on write/writeMany picks how the output is compressed: "template" (the default, as the
+#### template), "fast", "archival", "stored", or an OpenDocMill.Zip.CompressionPolicy; see OpenDocMill.Zip.
+####
+#### For very large documents, "deflateWorkers=[n]" on write deflates content.xml and styles.xml on n threads
+#### once they pass 4MB; smaller ones are compressed as usual.
+####
+#### "OpenDocMill.Metrics.enable()" times each phase of compiling and writing and counts bytes, rows and
+#### images, for export as JSON or Prometheus text; see OpenDocMill.Metrics.
+#### "OpenDocMill.Profile.enable()" breaks the render time and output bytes down by section, table and row,
+#### as a tree keyed by their identifiers; see OpenDocMill.Profile.
+#### "OpenDocMill.Memory.measureTemplate(template)" breaks down the memory a compiled template holds, and
+#### "OpenDocMill.Metrics.enable(memory=True)" records the peak allocation of each phase; see OpenDocMill.Memory.
+####
+#### "OpenDocMill.Serve.serve(lines, write, workers)" runs a job for each JSON line of input, keeping compiled
+#### templates warm between them, and writes one status line per job; runOpenDocMill.py --serve uses it.
+####
+#### To render book sections and the header/footer on several workers, pass
+#### "executor=OpenDocMill.makeExecutor(workers)" to write.  Each section is rendered into its own buffer and
+#### the buffers are joined in document order, so the output is the same as a sequential write.
 ####
 #### ######################################################################################################
 
+__version__ = "1.0"
+
 class DataError(Exception): pass
 class TemplateError(Exception): pass
 
 import OpenDocMill.Reader
+import OpenDocMill.StreamReader
+import OpenDocMill.Cache
+import OpenDocMill.Registry
+import OpenDocMill.CodeGen
+import OpenDocMill.Escape
+import OpenDocMill.Batch
+import OpenDocMill.Zip
+import OpenDocMill.Images
+import OpenDocMill.Schema
+import OpenDocMill.Metrics
+import OpenDocMill.Profile
+import OpenDocMill.Memory
+import OpenDocMill.Serve
 
 def getStructure(ob):
     if hasattr(ob, "getStructure"): return ob.getStructure()
     return ob
 
+def optimize(ob, chunks=None):
+    if hasattr(ob, "optimize"): return ob.optimize(chunks)
+    return 0
+
+RENDER_ENGINES = ("interpreted", "compiled")
+
+def setRenderEngine(ob, engine):
+    if hasattr(ob, "setRenderEngine"): ob.setRenderEngine(engine)
+
+def prepare(ob):
+    if hasattr(ob, "prepare"): ob.prepare()
+
+VALIDATION_MODES = ("default", "strict", "off")
+validation = "default"
+
+def setValidation(mode):
+    """How data is checked, process-wide: "default" type-checks every value given to
+    SectionData and finds missing ones while rendering; "strict" checks the values the
+    template uses, and that none are missing, before anything is written (see Schema);
+    "off" checks nothing, for trusted producers"""
+    global validation
+    if mode not in VALIDATION_MODES:
+        raise ValueError("Unknown validation mode %r, expected one of %r" % (mode, VALIDATION_MODES))
+    validation = mode
+
+def makeExecutor(workers=None, processes=False):
+    """Pool for ODTFileTemplate.write(..., executor=...).  Threads overlap
+    rendering with the zip's compression; processes also render sections
+    in parallel, but each section and its data are pickled to the worker."""
+    if processes:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+def renderSection(section, data):
+    """Renders one section into a buffer, on any thread or process;
+    returns its bytes and the Images it used"""
+    stream = io.BytesIO()
+    images = OpenDocMill.Images.ImageRegistry()
+    section.write(stream, data, images.add)
+    return stream.getvalue(), list(images)
+
+def writeRendered(stream, rendered, appendImage):
+    content, images = rendered
+    stream.write(content)
+    for image in images:
+        appendImage(image)
+
+def encodeText(text):
+    if isinstance(text, bytes): return text
+    return text.encode("UTF-8")
+
+def writeTextList(stream, parts):
+    for text in parts:
+        stream.write(encodeText(text))
+
+def shareChunk(chunk, chunks):
+    """The CHUNK element for chunk; chunks (if not None) maps each distinct
+    chunk to its element, so that repeated text is held once per template"""
+    if chunks is None: return ("CHUNK", chunk)
+    element = chunks.get(chunk)
+    if element is None:
+        element = chunks[chunk] = ("CHUNK", chunk)
+    return element
+
+def coalesceTextList(parts, chunks=None):
+    """Join a list of static text into one pre-encoded chunk"""
+    if not parts: return (), 0
+    return (shareChunk(b"".join(encodeText(x) for x in parts), chunks)[1],), len(parts) - 1
+
+def coalesceElements(elements, chunks=None):
+    """Merge each run of TEXT/CHUNK elements into a single pre-encoded CHUNK.
+
+    Returns the new elements, as a tuple, and the number of elements removed."""
+    newElements = []
+    run = []
+    for element in elements:
+        eType, e = element
+        if eType == "TEXT" or eType == "CHUNK":
+            run.append(encodeText(e))
+            continue
+        if run:
+            newElements.append(shareChunk(b"".join(run), chunks))
+            run = []
+        newElements.append(element)
+    if run:
+        newElements.append(shareChunk(b"".join(run), chunks))
+    return tuple(newElements), len(elements) - len(newElements)
+
 def oldFormatToBookData(data):
     bd = OpenDocMill.BookData()
     if not isinstance(data, (list, tuple)):
@@ -86,6 +231,13 @@ class ReportData(HeadFootData):
 
 class SectionData(object):
     def __init__(self, fields={}, tables={}, images={}):
+        if validation == "default":
+            self.checkData(fields, tables, images)
+        self.fields = fields
+        self.tables = self.wrapTables(tables)
+        self.images = images
+
+    def checkData(self, fields, tables, images):
         fieldErrors = self.findFieldErrors(fields)
         tableErrors = self.findTableErrors(tables)
         imageErrors = self.findImageErrors(images)
@@ -104,9 +256,19 @@ class SectionData(object):
                 errorString.append("    %s: %s\n" % (name, msg))
         if errorString:
             raise DataError("".join(errorString))
-        self.fields = fields
-        self.tables = tables
-        self.images = images
+
+    def wrapTables(self, tables):
+        # Rows that are not a list or tuple (generators, cursors, csv readers)
+        # are checked one by one as the table is rendered; dicts are columns
+        wrap = [name for name in tables if not isinstance(tables[name], (list, tuple, ColumnarTable))]
+        if not wrap: return tables
+        tables = dict(tables)
+        for name in wrap:
+            if isinstance(tables[name], dict):
+                tables[name] = ColumnarTable(tables[name])
+            else:
+                tables[name] = LazyTableRows(name, tables[name])
+        return tables
 
     def findFieldErrors(self, fields):
         fieldErrors = []
@@ -120,9 +282,15 @@ class SectionData(object):
         tableErrors = []
         for name in tables:
             rows = tables[name]
-            if not isinstance(rows, (list, tuple)):
-                tableErrors.append((name, "Expected list of row dicts: %r" % name))
+            if isinstance(rows, ColumnarTable): rows = rows.columns
+            if isinstance(rows, dict):
+                error = findColumnErrors(rows)
+                if error: tableErrors.append((name, error))
                 continue
+            if not isinstance(rows, (list, tuple)):
+                if isinstance(rows, (str, bytes)) or not hasattr(rows, "__iter__"):
+                    tableErrors.append((name, "Expected list of row dicts: %r" % name))
+                continue # any other iterable is checked as it is read
             if len(rows) == 0: continue
             badTypeRows = []
             for i, row in enumerate(rows):
@@ -134,79 +302,330 @@ class SectionData(object):
     def findImageErrors(self, images):
         imageErrors = []
         for name in images:
-            filename = images[name]
-            if not isinstance(filename, (str, bytes)):
-                imageErrors.append((name, "Filename is not a string: %r" % type(filename)))
+            source = images[name]
+            if not OpenDocMill.Images.isImageSource(source):
+                imageErrors.append((name, "Expected a filename, bytes or a function returning bytes: %r" % type(source)))
         return imageErrors
 
 
+class LazyTableRows(object):
+    """Table rows from any iterable, validated as they are consumed.
+
+    Only a single pass is possible if the underlying iterable is a
+    generator or cursor, so the data can only be rendered once."""
+    def __init__(self, tableName, rows):
+        self.tableName = tableName
+        self.rows = rows
+
+    def __iter__(self):
+        tableName = self.tableName
+        for i, row in enumerate(self.rows):
+            if not isinstance(row, dict):
+                raise DataError("Errors in tables:\n    %s: Bad types for rows: %d\n" % (tableName, i))
+            yield row
+
+
+def findColumnErrors(columns):
+    lengths = {}
+    for name, values in columns.items():
+        if isinstance(values, (str, bytes, dict)) or not hasattr(values, "__len__"):
+            return "Expected a list or array for column %r" % (name,)
+        lengths[name] = len(values)
+    if len(set(lengths.values())) > 1:
+        return "Columns have different lengths: %s" % ", ".join("%s=%d" % x for x in sorted(lengths.items()))
+    return None
+
+class ColumnarTable(object):
+    """Table data given by column: a dict of row variable name to a list,
+    tuple, NumPy array or pandas Series, all of the same length.
+
+    Rendering formats and escapes each column once (see
+    Escape.encodeColumn) and then interleaves them with the row's static
+    text, without building a dict per row."""
+    def __init__(self, columns):
+        error = findColumnErrors(columns)
+        if error: raise DataError(error)
+        self.columns = columns
+        self.nRows = len(next(iter(columns.values()))) if columns else 0
+        self.encoded = {}
+
+    def __len__(self):
+        return self.nRows
+
+    def __iter__(self):
+        # row dicts, for code that wants rows rather than columns
+        names = list(self.columns)
+        for values in zip(*[self.columns[n] for n in names]):
+            yield dict(zip(names, values))
+
+    def encodeColumn(self, name):
+        if name not in self.encoded:
+            self.encoded[name] = OpenDocMill.Escape.encodeColumn(self.columns[name])
+        return self.encoded[name]
+
+
 class ODTFileTemplate(object):
-    def __init__(self, inZipFilename):
+    rawMembers = None # (filename, compression): (CRC, compress_size, compressed bytes), filled in by prepare (or as members are copied)
+    inZipData = None
+    schema = None
+
+    def __init__(self, inZipFilename, inZipData=None):
         self.inZipFilename = inZipFilename
+        self.inZipData = inZipData # the template's bytes, if it was not read from a file
         self.contentTemplate = None
         self.stylesTemplate = None
-        self.imageList = []
+        self.elementsRemoved = 0
     
     def setContentTemplate(self, contentTemplate): self.contentTemplate = contentTemplate
     def setStylesTemplate(self, stylesTemplate): self.stylesTemplate = stylesTemplate
-    def appendImage(self, filename):
-        self.imageList.append(filename)
+    def appendImage(self, source):
+        # names an image without adding it to a document; write collects
+        # each document's images in an OpenDocMill.Images.ImageRegistry
+        return OpenDocMill.Images.getImage(source).arcName
 
     def getStructure(self):
         return getStructure(self.contentTemplate) + getStructure(self.stylesTemplate)
 
-    def write(self, outZipFilename, data):
-        inZipFile = zipfile.ZipFile(self.inZipFilename, "r")
-        outZipFile = zipfile.ZipFile(outZipFilename, "w")
+    def optimize(self):
+        """Coalesce static text throughout the template, keeping one copy of each
+        distinct chunk; returns the number of elements removed"""
+        chunks = {}
+        removed = optimize(self.contentTemplate, chunks) + optimize(self.stylesTemplate, chunks)
+        self.elementsRemoved += removed
+        self.schema = None
+        return removed
+
+    def getSchema(self):
+        """The fields, tables and columns the template uses; see OpenDocMill.Schema"""
+        if self.schema is None:
+            self.schema = OpenDocMill.Schema.TemplateSchema(self)
+        return self.schema
+
+    def validate(self, data):
+        """Raises DataError listing everything in data the template cannot be written with"""
+        self.getSchema().validate(data)
+
+    def setRenderEngine(self, engine):
+        """Render sections and rows with generated code ("compiled", see CodeGen) or by interpreting their elements ("interpreted")"""
+        if engine not in RENDER_ENGINES:
+            raise ValueError("Unknown render engine %r, expected one of %r" % (engine, RENDER_ENGINES))
+        setRenderEngine(self.contentTemplate, engine)
+        setRenderEngine(self.stylesTemplate, engine)
+
+    def prepare(self, compression=None):
+        """Generates the render functions and reads the members every document copies
+        (compressed as compression asks), rather than on first use; done before worker
+        processes are forked, they are shared by all of them"""
+        prepare(self.contentTemplate)
+        prepare(self.stylesTemplate)
+        policy = OpenDocMill.Zip.getCompressionPolicy(compression)
+        rendered = set(name for name, xmlTemplate in (("content.xml", self.contentTemplate), ("styles.xml", self.stylesTemplate))
+                       if xmlTemplate is not None)
+        with self.openInput() as inZipFile:
+            for fileInfo in inZipFile.filelist:
+                if fileInfo.filename not in rendered and fileInfo.filename != "META-INF/manifest.xml":
+                    self.getRawMember(inZipFile, fileInfo, self.getCopyCompression(fileInfo, policy))
+
+    def openInput(self):
+        if self.inZipData is not None:
+            return zipfile.ZipFile(io.BytesIO(self.inZipData), "r")
+        return zipfile.ZipFile(self.inZipFilename, "r")
+
+    def write(self, outZipFilename, data, executor=None, compression=None, deflateWorkers=None):
+        with OpenDocMill.Metrics.timer("write"):
+            self.writeDocument(outZipFilename, data, executor, compression, deflateWorkers)
+        OpenDocMill.Metrics.count("documents")
+
+    def writeDocument(self, outZipFilename, data, executor=None, compression=None, deflateWorkers=None):
+        ### outZipFilename can also be a writable binary file object; if it cannot seek
+        ### (a socket, a WSGI response), the sizes of members follow their data
+        policy = OpenDocMill.Zip.getCompressionPolicy(compression)
+        if validation == "strict":
+            with OpenDocMill.Metrics.timer("write.validate"):
+                self.validate(data) # before any output
+        images = OpenDocMill.Images.ImageRegistry()
+        with OpenDocMill.Metrics.timer("write.open"):
+            inZipFile = self.openInput()
+            outZipFile = zipfile.ZipFile(outZipFilename, "w")
         ### zipfile treats the .odt files like an archive.
         ### .odt contains files 'content.xml' - and 'styles.xml'
         ### function creates new file, copies template data across line by line
         ### finds replaceable variables in template ---.xml files
         ### and replaces/appends with inData as it writes to output file
 
+        ### with an executor, all sections are started before anything is written,
+        ### so the styles' header and footer render while content.xml is written
+        writeParts = {}
+        if executor is not None:
+            for name, xmlTemplate in (("content.xml", self.contentTemplate), ("styles.xml", self.stylesTemplate)):
+                if xmlTemplate is not None:
+                    writeParts[name] = xmlTemplate.submitParts(executor, data)
+
         for fileInfo in inZipFile.filelist:
             if fileInfo.filename == "content.xml" and self.contentTemplate is not None:
-                s = io.StringIO()
-                self.contentTemplate.write(s, data, self.appendImage)
-                content_str = s.getvalue()
-                if not content_str.strip():
-                    # If content is empty, copy the original content.xml
-                    outZipFile.writestr(fileInfo, inZipFile.read(fileInfo.filename))
-                else:
-                    # Write the content directly without pretty printing
-                    outZipFile.writestr(fileInfo, content_str.encode('UTF-8'))
-                        
+                with OpenDocMill.Metrics.timer("write.content.xml"):
+                    self.writeXMLMember(inZipFile, outZipFile, fileInfo, self.contentTemplate, data, writeParts.get(fileInfo.filename), policy, deflateWorkers, images.add)
             elif fileInfo.filename == "styles.xml" and self.stylesTemplate is not None:
-                s = io.StringIO()
-                self.stylesTemplate.write(s, data, self.appendImage)
-                styles_str = s.getvalue()
-                if not styles_str.strip():
-                    # If styles is empty, copy the original styles.xml
-                    outZipFile.writestr(fileInfo, inZipFile.read(fileInfo.filename))
-                else:
-                    # Write the styles directly without pretty printing
-                    outZipFile.writestr(fileInfo, styles_str.encode('UTF-8'))
-                        
+                with OpenDocMill.Metrics.timer("write.styles.xml"):
+                    self.writeXMLMember(inZipFile, outZipFile, fileInfo, self.stylesTemplate, data, writeParts.get(fileInfo.filename), policy, deflateWorkers, images.add)
             elif fileInfo.filename == "META-INF/manifest.xml":
                 pass # XXX will do this at the end, to add images
             else:
-                outZipFile.writestr(fileInfo, inZipFile.read(fileInfo.filename))
-
-        for filename in self.imageList:
-            basename = os.path.basename(filename)
-            outZipFile.write(filename, arcname="Pictures/%s" % basename)
+                with OpenDocMill.Metrics.timer("write.copy"):
+                    self.copyMember(inZipFile, outZipFile, fileInfo, policy)
+
+        with OpenDocMill.Metrics.timer("write.images"):
+            for image in images:
+                outZipFile.writestr(image.arcName, image.data, *(policy.getCompression(image.arcName) or ()))
+                OpenDocMill.Metrics.count("images")
+                OpenDocMill.Metrics.count("image_bytes", len(image.data))
        
         manifestFileList = [x for x in inZipFile.filelist if x.filename == "META-INF/manifest.xml"]
         if manifestFileList:
             manifestFileInfo = manifestFileList[0]
             manifestStr = inZipFile.read(manifestFileInfo.filename).decode('UTF-8')
-            extraFileTags = ["""<manifest:file-entry manifest:media-type="image/png" manifest:full-path="Pictures/%s"/>""" % os.path.basename(f) for f in self.imageList]
-            newManifestStr = re.sub(r"(?=<manifest:file-entry\b)", "".join(extraFileTags), manifestStr)
+            extraFileTags = ["""<manifest:file-entry manifest:media-type="%s" manifest:full-path="%s"/>""" % (image.mediaType, image.arcName) for image in images]
+            newManifestStr = re.sub(r"(?=<manifest:file-entry\b)", "".join(extraFileTags), manifestStr, count=1)
             # Write manifest directly without pretty printing
-            outZipFile.writestr(manifestFileInfo, newManifestStr.encode('UTF-8'))
+            outZipFile.writestr(OpenDocMill.Zip.applyCompression(manifestFileInfo, policy.getCompression(manifestFileInfo.filename)),
+                                newManifestStr.encode('UTF-8'))
 
+        if OpenDocMill.Metrics.current is not None:
+            OpenDocMill.Metrics.count("output_bytes", sum(x.compress_size for x in outZipFile.filelist))
         outZipFile.close()
 
+    def writeBytes(self, data, executor=None, compression=None, deflateWorkers=None):
+        """Returns the document as bytes"""
+        stream = io.BytesIO()
+        self.write(stream, data, executor, compression, deflateWorkers)
+        return stream.getvalue()
+
+    def writeMany(self, jobs, workers=None, maxPending=None, compression=None):
+        """Writes each (outZipFilename, data) in jobs on a pool of worker processes; see OpenDocMill.Batch"""
+        return OpenDocMill.Batch.writeMany(self, jobs, workers, maxPending, compression)
+
+    def writeXMLMember(self, inZipFile, outZipFile, fileInfo, xmlTemplate, data, writeParts=None, policy=None, deflateWorkers=None, appendImage=None):
+        policy = OpenDocMill.Zip.getCompressionPolicy(policy)
+        # Render straight into the zip entry, so the document is never held
+        # in memory as a whole
+        writer = ZipEntryWriter(outZipFile, OpenDocMill.Zip.applyCompression(fileInfo, policy.getCompression(fileInfo.filename)),
+                                deflateWorkers=deflateWorkers)
+        start = time.perf_counter()
+        try:
+            xmlTemplate.write(writer, data, appendImage or self.appendImage, writeParts)
+        finally:
+            written = writer.close()
+            metrics = OpenDocMill.Metrics.current
+            if metrics is not None:
+                # rendering is timed without the deflating done along the way
+                metrics.addTime("write.render." + fileInfo.filename, time.perf_counter() - start - writer.deflateTime)
+                metrics.count("rendered_bytes", writer.total, member=fileInfo.filename)
+        if not written:
+            # If the rendered xml is empty, copy the original
+            self.copyMember(inZipFile, outZipFile, fileInfo, policy)
+
+    def getCopyCompression(self, fileInfo, policy=None):
+        compression = OpenDocMill.Zip.getCompressionPolicy(policy).getCompression(fileInfo.filename)
+        if compression == (fileInfo.compress_type, None):
+            return None # already compressed that way
+        return compression
+
+    def getRawMember(self, inZipFile, fileInfo, compression):
+        """The compressed bytes of a member of the template, as compression asks; these
+        are read (or recompressed) once and kept for later documents.  None if the
+        member cannot be copied that way"""
+        if not (OpenDocMill.Zip.canCopyRaw(fileInfo) and OpenDocMill.Zip.canCompressRaw(compression)
+                and OpenDocMill.Zip.internalsSupported(inZipFile)):
+            return None
+        if self.rawMembers is None:
+            self.rawMembers = {}
+        key = (fileInfo.filename, compression)
+        cached = self.rawMembers.get(key)
+        if cached is None or cached[:2] != (fileInfo.CRC, fileInfo.compress_size):
+            # not read yet, or the template file has changed since
+            if compression is None:
+                raw = OpenDocMill.Zip.readRawMember(inZipFile, fileInfo)
+            else:
+                raw = OpenDocMill.Zip.compressRaw(inZipFile.read(fileInfo.filename), *compression)
+            cached = (fileInfo.CRC, fileInfo.compress_size, raw)
+            self.rawMembers[key] = cached
+            OpenDocMill.Metrics.count("template_bytes_read", len(raw))
+        return cached[2]
+
+    def copyMember(self, inZipFile, outZipFile, fileInfo, policy=None):
+        """Copies a member of the template unchanged, as its compressed bytes where it can"""
+        compression = self.getCopyCompression(fileInfo, policy)
+        outInfo = OpenDocMill.Zip.applyCompression(fileInfo, compression)
+        raw = None
+        if OpenDocMill.Zip.internalsSupported(outZipFile):
+            raw = self.getRawMember(inZipFile, fileInfo, compression)
+        if raw is None:
+            # zipfile's public interface, which inflates and deflates the member again
+            outZipFile.writestr(outInfo, inZipFile.read(fileInfo.filename))
+            return
+        OpenDocMill.Zip.writeRawMember(outZipFile, outInfo, raw)
+        OpenDocMill.Metrics.count("copied_bytes", len(raw))
+
+class ZipEntryWriter(object):
+    """Binary stream that collects small writes into chunks and writes them
+    to a zip entry.  The entry is only opened once something other than
+    whitespace has been written; close() returns whether it was.
+
+    With deflateWorkers, an entry of at least parallelThreshold bytes is
+    deflated on that many threads, a block at a time, where zipfile's internals
+    allow (see OpenDocMill.Zip.ParallelDeflateWriter); until then the output is
+    held back, so small entries take the plain path."""
+    def __init__(self, zipFile, zipInfo, chunkSize=1 << 16, deflateWorkers=None, parallelThreshold=1 << 22):
+        self.zipFile = zipFile
+        self.zipInfo = zipInfo
+        self.chunkSize = chunkSize
+        self.deflateWorkers = deflateWorkers if zipInfo.compress_type == zipfile.ZIP_DEFLATED else None
+        self.parallelThreshold = parallelThreshold
+        self.flushSize = parallelThreshold if self.deflateWorkers and self.deflateWorkers > 1 else chunkSize
+        self.parts = []
+        self.size = 0
+        self.entry = None
+        self.total = 0
+        self.deflateTime = 0.0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= self.flushSize:
+            self.flush()
+
+    def flush(self):
+        chunk = b"".join(self.parts)
+        if self.entry is None:
+            if not chunk.strip():
+                # only whitespace so far: keep it, it may be all there is
+                self.parts = [chunk]
+                return
+            if (self.flushSize > self.chunkSize and len(chunk) >= self.parallelThreshold
+                    and OpenDocMill.Zip.internalsSupported(self.zipFile)):
+                self.entry = OpenDocMill.Zip.ParallelDeflateWriter(self.zipFile, self.zipInfo, self.deflateWorkers)
+            else:
+                self.entry = self.zipFile.open(self.zipInfo, "w")
+            self.flushSize = self.chunkSize
+        self.total += len(chunk)
+        metrics = OpenDocMill.Metrics.current
+        if metrics is None:
+            self.entry.write(chunk)
+        else:
+            start = time.perf_counter()
+            self.entry.write(chunk)
+            elapsed = time.perf_counter() - start
+            self.deflateTime += elapsed
+            metrics.addTime("write.deflate", elapsed)
+        self.parts = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        if self.entry is None: return False
+        self.entry.close()
+        return True
+
 class XMLFileTemplate(object):
     def __init__(self, identifier, appendImage):
         self.identifier = identifier
@@ -220,11 +639,36 @@ class XMLFileTemplate(object):
     def addAfterText(self, text):
         self.afterText.append(text)
 
-    def write(self, stream, data, appendImage):
-        # Ok, now actually write data
-        stream.writelines(self.beforeText)
-        self.writeParts(stream, data, appendImage)
-        stream.writelines(self.afterText)
+    def getSections(self):
+        return []
+
+    def optimize(self, chunks=None):
+        self.beforeText, removedBefore = coalesceTextList(self.beforeText, chunks)
+        self.afterText, removedAfter = coalesceTextList(self.afterText, chunks)
+        return removedBefore + removedAfter + sum(optimize(x, chunks) for x in self.getSections())
+
+    def setRenderEngine(self, engine):
+        for section in self.getSections():
+            section.setRenderEngine(engine)
+
+    def prepare(self):
+        for section in self.getSections():
+            section.prepare()
+
+    def write(self, stream, data, appendImage, writeParts=None):
+        # Ok, now actually write data; stream is binary, output is UTF-8
+        # writeParts, from submitParts, writes sections already rendered elsewhere
+        writeTextList(stream, self.beforeText)
+        if writeParts is None:
+            self.writeParts(stream, data, appendImage)
+        else:
+            writeParts(stream, appendImage)
+        writeTextList(stream, self.afterText)
+
+    def submitParts(self, executor, data):
+        """Starts rendering the sections on executor; returns a function that
+        writes them, in order, to (stream, appendImage) in place of writeParts"""
+        return lambda stream, appendImage: self.writeParts(stream, data, appendImage)
 
 
 class ReportContentTemplate(XMLFileTemplate):
@@ -240,6 +684,9 @@ class ReportContentTemplate(XMLFileTemplate):
     def getStructure(self):
         return [("content", "", x) for x in getStructure(self.mainSection)]
 
+    def getSections(self):
+        return [self.mainSection] if self.mainSection is not None else []
+
     def writeParts(self, stream, data, appendImage):
         if self.mainSection is None:
             raise TemplateError("need to call addMainSection before write")
@@ -249,6 +696,8 @@ class ReportContentTemplate(XMLFileTemplate):
 
 
 class BookContentTemplate(XMLFileTemplate):
+    sectionIndex = None # base name: first section with it, see getSectionIndex
+
     def __init__(self, *args, **kwargs):
         super(BookContentTemplate, self).__init__(*args, **kwargs)
         self.sections = {}
@@ -265,6 +714,7 @@ class BookContentTemplate(XMLFileTemplate):
             self.section_count[base_name] = 1
             
         self.sections[name] = section
+        self.sectionIndex = None
 
     def getStructure(self):
         structure = []
@@ -273,33 +723,55 @@ class BookContentTemplate(XMLFileTemplate):
                 structure.append(("content", name.split('_')[0], x))  # Use base name without counter
         return structure
 
-    def writeParts(self, stream, data, appendImage):
+    def getSections(self):
+        return list(self.sections.values())
+
+    def getSectionIndex(self):
+        """Maps each base name (the section name up to the first '_') to the first
+        template section with it; data sections are matched against these"""
+        if self.sectionIndex is None:
+            index = {}
+            for name, section in self.sections.items():
+                index.setdefault(name.split('_')[0], section)
+            self.sectionIndex = index
+        return self.sectionIndex
+
+    def optimize(self, chunks=None):
+        # build the index with the rest of the compiled template
+        self.getSectionIndex()
+        return super(BookContentTemplate, self).optimize(chunks)
+
+    def getBookData(self, data):
         if isinstance(data, BookData):
-            dataOb = data
+            return data
         elif isinstance(data, (list, tuple)):
-            dataOb = oldFormatToBookData(data)
+            return oldFormatToBookData(data)
         else:
             raise TypeError("Expected BookData object, not %r" % type(data))
 
+    def getParts(self, dataOb):
+        """Returns the error strings for missing sections, and (i, sectionName, section, sectionData)
+        for each data section found in the template"""
         errorStrings = []
+        parts = []
+        index = self.getSectionIndex()
 
         # Check for missing sections using base names
         sectionNames = set(x[0] for x in dataOb.sections)
-        baseNames = set(name.split('_')[0] for name in self.sections.keys())
-        missingSections = sectionNames - baseNames
+        missingSections = sectionNames.difference(index)
         if missingSections:
             errorStrings.append(("The following sections are in the data but not the template: %r" % tuple(sorted(missingSections))))
 
-        # Map data sections to template sections
+        # Map data sections to template sections by base name
         for i, (sectionName, sectionData) in enumerate(dataOb.sections):
-            # Find matching section (either exact match or base name match)
-            section = None
-            for template_name, template_section in self.sections.items():
-                if template_name.split('_')[0] == sectionName:
-                    section = template_section
-                    break
-                    
+            section = index.get(sectionName)
             if section is None: continue  # error trapped above
+            parts.append((i, sectionName, section, sectionData))
+        return errorStrings, parts
+
+    def writeParts(self, stream, data, appendImage):
+        errorStrings, parts = self.getParts(self.getBookData(data))
+        for i, sectionName, section, sectionData in parts:
             try:
                 section.write(stream, sectionData, appendImage)
             except (DataError, TypeError) as ex:
@@ -308,6 +780,25 @@ class BookContentTemplate(XMLFileTemplate):
         if errorStrings:
             raise DataError("\n".join(errorStrings))
 
+    def submitParts(self, executor, data):
+        try:
+            errorStrings, parts = self.getParts(self.getBookData(data))
+        except TypeError:
+            # raised when the content is written, as writeParts would
+            return super(BookContentTemplate, self).submitParts(executor, data)
+        futures = [executor.submit(renderSection, section, sectionData) for _, _, section, sectionData in parts]
+
+        def writeParts(stream, appendImage):
+            for (i, sectionName, _, _), future in zip(parts, futures):
+                try:
+                    writeRendered(stream, future.result(), appendImage)
+                except (DataError, TypeError) as ex:
+                    msg = str(ex)
+                    errorStrings.append("section %i (%r): %s" % (i, sectionName, msg))
+            if errorStrings:
+                raise DataError("\n".join(errorStrings))
+        return writeParts
+
 
 class StylesTemplate(XMLFileTemplate):
     def __init__(self, *args, **kwargs):
@@ -329,28 +820,68 @@ class StylesTemplate(XMLFileTemplate):
             structure.append(("styles", "footer", x))
         return structure
 
-    def writeParts(self, stream, data, appendImage):
+    def getSections(self):
+        return [x for x in (self.headerSection, self.footerSection) if x is not None]
+
+    def getParts(self, data):
         if isinstance(data, (list, tuple)):
             dataOb = oldFormatToBookData(data)
         elif isinstance(data, HeadFootData):
             dataOb = data
         else:
             raise TypeError("Expected HeadFootData object like ReportData or BookData (or alternatively a list), not %r" % type(data))
+        parts = []
         if self.headerSection is not None:
-            self.headerSection.write(stream, dataOb.headerData, appendImage)
+            parts.append((self.headerSection, dataOb.headerData))
         if self.footerSection is not None:
-            self.footerSection.write(stream, dataOb.footerData, appendImage)
+            parts.append((self.footerSection, dataOb.footerData))
+        return parts
+
+    def writeParts(self, stream, data, appendImage):
+        for section, sectionData in self.getParts(data):
+            section.write(stream, sectionData, appendImage)
+
+    def submitParts(self, executor, data):
+        try:
+            parts = self.getParts(data)
+        except TypeError:
+            return super(StylesTemplate, self).submitParts(executor, data)
+        futures = [executor.submit(renderSection, section, sectionData) for section, sectionData in parts]
+
+        def writeParts(stream, appendImage):
+            for future in futures:
+                writeRendered(stream, future.result(), appendImage)
+        return writeParts
+
+
+def internName(name):
+    # names and identifiers recur throughout a template (and across templates)
+    return name if name is None else sys.intern(name)
+
+def getSlotState(ob):
+    # generated functions are rebuilt on first use rather than pickled
+    return dict((name, getattr(ob, name)) for name in ob.__slots__ if name != "renderFunction")
+
+def setSlotState(ob, state):
+    for name, value in state.items():
+        setattr(ob, name, value)
+    if "renderFunction" in ob.__slots__:
+        ob.renderFunction = None
 
 
 class Section(object):
+    __slots__ = ("identifier", "elements", "renderEngine", "renderFunction")
+
     def __init__(self, identifier):
-        self.identifier = identifier
+        self.identifier = internName(identifier)
         self.elements = []
+        self.renderEngine = "interpreted"
+        self.renderFunction = None
 
     def addText(self, text): self.elements.append(("TEXT", text))
-    def addVariable(self, varName): self.elements.append(("VARIABLE", varName))
-    def addTable(self, tableName, table): self.elements.append(("TABLE", (tableName, table)))
-    def addImage(self, imageName, defaultArcFilename): self.elements.append(("IMAGE", (imageName, defaultArcFilename)))
+    def addVariable(self, varName): self.elements.append(("VARIABLE", internName(varName)))
+    def addTable(self, tableName, table): self.elements.append(("TABLE", (internName(tableName), table)))
+    def addImage(self, imageName, defaultArcFilename): self.elements.append(("IMAGE", (internName(imageName), defaultArcFilename)))
 
     def getStructure(self):
         variables = []
@@ -363,34 +894,71 @@ class Section(object):
                     variables.append(tName + "." + v)
         return variables
 
+    def optimize(self, chunks=None):
+        self.elements, removed = coalesceElements(self.elements, chunks)
+        self.renderFunction = None
+        for eType, eVal in self.elements:
+            if eType == "TABLE":
+                removed += optimize(eVal[1], chunks)
+        return removed
+
+    def setRenderEngine(self, engine):
+        self.renderEngine = engine
+        self.renderFunction = None
+        for eType, eVal in self.elements:
+            if eType == "TABLE":
+                setRenderEngine(eVal[1], engine)
+
+    def prepare(self):
+        self.getWriter()
+        for eType, eVal in self.elements:
+            if eType == "TABLE":
+                prepare(eVal[1])
+
+    def getWriter(self):
+        if self.renderEngine == "compiled":
+            if self.renderFunction is None:
+                self.renderFunction = OpenDocMill.CodeGen.compileSection(self)
+            return self.renderFunction
+        return self.writeInterpreted
+
+    def __getstate__(self):
+        return getSlotState(self)
+
+    def __setstate__(self, state):
+        setSlotState(self, state)
+
     def __repr__(self):
         return "Section(" + '\n'.join([repr(x) for x in self.elements]) + ")"
 
     def write(self, stream, data, appendImage):
         if not isinstance(data, SectionData):
             raise TypeError("Expected SectionData, not %r" % type(data))
+        profiler = OpenDocMill.Profile.current
+        if profiler is not None:
+            profiler.writeSection(self, stream, data, appendImage)
+            return
+        self.getWriter()(stream, data, appendImage)
+
+    def writeInterpreted(self, stream, data, appendImage):
         fieldData = data.fields
         tableData = data.tables
         imageData = data.images
 
         for eType, e in self.elements:
-            if eType == "TEXT":
+            if eType == "CHUNK":
                 stream.write(e)
+            elif eType == "TEXT":
+                stream.write(e.encode("UTF-8"))
             elif eType == "VARIABLE":
                 try:
-                    rawString = str(fieldData[e])
+                    v = fieldData[e]
                 except KeyError:
                     raise ValueError("No value for field %r in section %r" % (e, self.identifier))
-                stream.write(xmlEscape(rawString))
+                stream.write(OpenDocMill.Escape.encodeFieldValue(v))
             elif eType == "IMAGE":
                 imageName, defaultArcFilename = e
-                filename = imageData.get(imageName)
-                if filename is None:
-                    rawArcFilename = defaultArcFilename
-                else:
-                    rawArcFilename = "Pictures/%s" % os.path.basename(filename)
-                    appendImage(filename)
-                stream.write(xmlEscapeAttr(rawArcFilename))
+                stream.write(imageHref(imageData, imageName, defaultArcFilename, appendImage))
             elif eType == "TABLE":
                 tableName, table = e
                 try:
@@ -403,8 +971,10 @@ class Section(object):
 
 
 class Table(object):
+    __slots__ = ("identifier", "beforeText", "row", "afterText")
+
     def __init__(self, identifier):
-        self.identifier = identifier
+        self.identifier = internName(identifier)
         self.beforeText = []
         self.row = None
         self.afterText = []
@@ -416,6 +986,23 @@ class Table(object):
     def getStructure(self):
         return getStructure(self.row)
 
+    def optimize(self, chunks=None):
+        self.beforeText, removedBefore = coalesceTextList(self.beforeText, chunks)
+        self.afterText, removedAfter = coalesceTextList(self.afterText, chunks)
+        return removedBefore + removedAfter + optimize(self.row, chunks)
+
+    def setRenderEngine(self, engine):
+        setRenderEngine(self.row, engine)
+
+    def prepare(self):
+        prepare(self.row)
+
+    def __getstate__(self):
+        return getSlotState(self)
+
+    def __setstate__(self, state):
+        setSlotState(self, state)
+
     def __repr__(self):
         return '\n'.join(
             ["    TBLB: %r" % x for x in self.beforeText]
@@ -423,20 +1010,39 @@ class Table(object):
             + ["    TBLA: %r" % x for x in self.afterText])
 
     def write(self, stream, data):
-        stream.writelines(self.beforeText)
-        for i in range(len(data)):
-            rowFields = data[i]
-            self.row.write(stream, rowFields, rowNo=i)
-        stream.writelines(self.afterText)
+        profiler = OpenDocMill.Profile.current
+        if profiler is not None:
+            profiler.writeTable(self, stream, data)
+            return
+        self.writeRows(stream, data, self.row.getWriter())
+
+    def writeRows(self, stream, data, writeRow):
+        """Writes the table with writeRow(stream, fields, rowNo) for each row
+        (unless data is a ColumnarTable); returns the number of rows"""
+        writeTextList(stream, self.beforeText)
+        if isinstance(data, ColumnarTable):
+            self.row.writeColumns(stream, data)
+            rows = len(data)
+        else:
+            rows = 0
+            for rows, rowFields in enumerate(data, 1):
+                writeRow(stream, rowFields, rows - 1)
+        writeTextList(stream, self.afterText)
+        OpenDocMill.Metrics.count("rows", rows, table=self.identifier)
+        return rows
 
 
 class Row(object):
+    __slots__ = ("tableIdentifier", "elements", "renderEngine", "renderFunction")
+
     def __init__(self, tableIdentifier):
-        self.tableIdentifier = tableIdentifier
+        self.tableIdentifier = internName(tableIdentifier)
         self.elements = []
+        self.renderEngine = "interpreted"
+        self.renderFunction = None
 
     def addText(self, text): self.elements.append(("TEXT", text))
-    def addVariable(self, varName): self.elements.append(("VARIABLE", varName))
+    def addVariable(self, varName): self.elements.append(("VARIABLE", internName(varName)))
 
     def getStructure(self):
         parts = []
@@ -444,31 +1050,87 @@ class Row(object):
             if eType == "VARIABLE": parts.append(eVal)
         return parts
 
+    def optimize(self, chunks=None):
+        self.elements, removed = coalesceElements(self.elements, chunks)
+        self.renderFunction = None
+        return removed
+
+    def setRenderEngine(self, engine):
+        self.renderEngine = engine
+        self.renderFunction = None
+
+    def prepare(self):
+        self.getWriter()
+
+    def getWriter(self):
+        if self.renderEngine == "compiled":
+            if self.renderFunction is None:
+                self.renderFunction = OpenDocMill.CodeGen.compileRow(self)
+            return self.renderFunction
+        return self.writeInterpreted
+
+    def __getstate__(self):
+        return getSlotState(self)
+
+    def __setstate__(self, state):
+        setSlotState(self, state)
+
     def __repr__(self):
         return '\n'.join(["    %r" % (x,) for x in self.elements])
 
     def write(self, stream, fields, rowNo):
+        self.getWriter()(stream, fields, rowNo)
+
+    def writeColumns(self, stream, table, blockSize=1024):
+        """Write every row of a ColumnarTable"""
+        if len(table) == 0: return
+        columns = []
         for eType, e in self.elements:
-            if eType == "TEXT":
+            if eType == "CHUNK":
+                columns.append(itertools.repeat(e))
+            elif eType == "TEXT":
+                columns.append(itertools.repeat(e.encode("UTF-8")))
+            elif eType == "VARIABLE":
+                if e not in table.columns:
+                    raise ValueError("No value for field %r in table %r[row=%d]" % (e, self.tableIdentifier, 0))
+                columns.append(table.encodeColumn(e))
+            else:
+                raise ValueError("Unknown type %r in template, table %r" % (eType, self.tableIdentifier))
+        rows = itertools.islice(zip(*columns), len(table))
+        while True:
+            block = list(itertools.islice(rows, blockSize))
+            if not block: break
+            stream.write(b"".join(itertools.chain.from_iterable(block)))
+
+    def writeInterpreted(self, stream, fields, rowNo):
+        encodeRowValue = OpenDocMill.Escape.encodeRowValue
+        for eType, e in self.elements:
+            if eType == "CHUNK":
                 stream.write(e)
+            elif eType == "TEXT":
+                stream.write(e.encode("UTF-8"))
             elif eType == "VARIABLE":
                 try:
                     v = fields[e]
-                    if v is None:
-                        rawString = ""
-                    elif isinstance(v, str):
-                        rawString = v
-                    else:
-                        rawString = str(v)
                 except KeyError as ex:
                     raise ValueError("No value for field %r in table %r[row=%d]" % (e, self.tableIdentifier, rowNo))
-                stream.write(xmlEscape(rawString))
+                stream.write(encodeRowValue(v))
             else:
                 raise ValueError("Unknown type %r in template, table %r" % (eType, self.tableIdentifier))
 
 
+def imageHref(imageData, imageName, defaultArcFilename, appendImage):
+    """Escaped, encoded href for an image placeholder; registers the image if the data replaces it"""
+    source = imageData.get(imageName)
+    if source is None:
+        rawArcFilename = defaultArcFilename
+    else:
+        rawArcFilename = appendImage(source)
+        if rawArcFilename is None: # an appendImage that just collects sources
+            rawArcFilename = OpenDocMill.Images.getImage(source).arcName
+    return OpenDocMill.Escape.encodeAttr(rawArcFilename)
+
 def xmlEscape(s):
-    print("s=%r" % (s,))
-    return s.replace('&', '&amp;').replace('<', '&lt;')
+    return OpenDocMill.Escape.escapeText(s)
 def xmlEscapeAttr(s):
-    return s.replace('&', '&amp;').replace('<', '&lt;').replace('"', '&quot;')
\ No newline at end of file
+    return OpenDocMill.Escape.escapeAttr(s)
\ No newline at end of file
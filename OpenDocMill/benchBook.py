@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""Times book rendering against the number of data and template sections.
+
+Compiles a synthetic book content.xml (see benchCompile) with the given
+numbers of headings, then renders BookData with many sections cycling
+through them, and prints the time per data section.  With sections looked
+up by name, the last column does not grow with the number of headings.
+"""
+
+import sys
+import os
+import io
+import time
+
+scriptdir = os.path.dirname(sys.argv[0])
+libdir = os.path.join(scriptdir, "OpenDocMill")
+if os.path.isdir(libdir):
+    sys.path.append(libdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+from benchCompile import makeContent
+
+def makeBookData(nTemplateSections, nDataSections):
+    data = OpenDocMill.BookData()
+    for j in range(nDataSections):
+        i = j % nTemplateSections
+        data.addSection("S%d" % i, OpenDocMill.SectionData(
+            fields={"f%d" % i: "value %d" % j},
+            tables={"t%d" % i: [dict(k="key %d" % r, v=r) for r in range(3)]}))
+    return data
+
+def timeWrite(template, data, repeat=3):
+    best = None
+    for _ in range(repeat):
+        stream = io.BytesIO()
+        start = time.perf_counter()
+        template.write(stream, data, lambda source: None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(args):
+    nData = int(args[0]) if args else 10000
+    headings = [int(x) for x in args[1:]] or [10, 100, 1000]
+    print("%8s %8s %10s %12s" % ("headings", "sections", "seconds", "us/section"))
+    for nTemplate in headings:
+        template = OpenDocMill.Reader.readBookContentXML(io.BytesIO(makeContent(nTemplate)), "bench", None)
+        template.optimize()
+        template.setRenderEngine("compiled")
+        t = timeWrite(template, makeBookData(nTemplate, nData))
+        print("%8d %8d %10.4f %12.1f" % (nTemplate, nData, t, t / nData * 1e6))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
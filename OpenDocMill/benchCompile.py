@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""Times template compilation against template size.
+
+Builds synthetic content.xml documents with an increasing number of book
+sections, each with some boilerplate and a repeat table holding a nested
+table, compiles each with the minidom and the streaming reader, and prints
+the time per section.  With compilation linear in template size, the last column stays
+flat as the size doubles.
+"""
+
+import sys
+import os
+import io
+import time
+
+scriptdir = os.path.dirname(sys.argv[0])
+libdir = os.path.join(scriptdir, "OpenDocMill")
+if os.path.isdir(libdir):
+    sys.path.append(libdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+
+HEAD = ('<?xml version="1.0" encoding="UTF-8"?>'
+    '<office:document-content'
+    ' xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+    ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"'
+    ' xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0">'
+    '<office:body><office:text><text:variable-decls/>')
+TAIL = '</office:text></office:body></office:document-content>'
+
+def cell(content):
+    return '<table:table-cell><text:p>%s</text:p></table:table-cell>' % content
+
+def var(name):
+    return '<text:variable-set text:name="%s">%s</text:variable-set>' % (name, name)
+
+def section(i):
+    inner = ('<table:table table:name="inner%d">' % i
+        + '<table:table-row>' + cell("a") + cell("b") + '</table:table-row>'
+        + '</table:table>')
+    outer = ('<table:table table:name="t%d"><table:table-column/>' % i
+        + '<table:table-row><table:table-cell>' + inner + '</table:table-cell>'
+        + cell("Value") + '</table:table-row>'
+        + '<table:table-row>' + cell(var("t%d.k" % i)) + cell(var("t%d.v" % i)) + '</table:table-row>'
+        + '</table:table>')
+    return ('<text:h text:outline-level="1">S%d</text:h>' % i
+        + '<text:p>Boilerplate paragraph %d with some text.</text:p>' % i
+        + '<text:p>' + var("f%d" % i) + '</text:p>'
+        + outer)
+
+def makeContent(nSections):
+    return (HEAD + "".join(section(i) for i in range(nSections)) + TAIL).encode("UTF-8")
+
+def timeCompile(xml, useDOM, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        OpenDocMill.Reader.readBookContentXML(io.BytesIO(xml), "bench", None, useDOM)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(args):
+    sizes = [int(x) for x in args] or [250, 500, 1000, 2000, 4000]
+    print("%8s %10s %8s %10s %12s" % ("sections", "bytes", "reader", "seconds", "us/section"))
+    for n in sizes:
+        xml = makeContent(n)
+        for useDOM in (True, False):
+            t = timeCompile(xml, useDOM)
+            print("%8d %10d %8s %10.4f %12.1f" % (n, len(xml), "minidom" if useDOM else "expat", t, t / n * 1e6))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
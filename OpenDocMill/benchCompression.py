@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Compares output size and write time for each compression policy.
+
+Writes invoiceTemplate.odt with an items table of the given number of rows
+once per policy in OpenDocMill.Zip.COMPRESSION_POLICIES, and prints the
+best time of a few runs and the size of the document.  With a second
+argument, each policy is run again deflating on that many threads.
+"""
+
+import sys
+import os
+import time
+import tempfile
+
+scriptdir = os.path.dirname(sys.argv[0])
+libdir = os.path.join(scriptdir, "OpenDocMill")
+if os.path.isdir(libdir):
+    sys.path.append(libdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+import OpenDocMill.Zip
+from benchRender import makeData
+
+def timeWrite(template, data, outFilename, compression, deflateWorkers=None, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        template.write(outFilename, data, compression=compression, deflateWorkers=deflateWorkers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, os.path.getsize(outFilename)
+
+def main(args):
+    nRows = int(args[0]) if args else 20000
+    templateFile = os.path.join(scriptdir, "invoiceTemplate.odt")
+    template = OpenDocMill.Reader.readReportODT(templateFile)
+    workers = [None] + [int(x) for x in args[1:2]]
+    data = makeData(nRows)
+    print("%10s %8s %8s %10s %12s" % ("policy", "rows", "threads", "seconds", "bytes"))
+    with tempfile.TemporaryDirectory() as tmpDir:
+        outFilename = os.path.join(tmpDir, "out.odt")
+        for name in sorted(OpenDocMill.Zip.COMPRESSION_POLICIES):
+            for deflateWorkers in workers:
+                t, size = timeWrite(template, data, outFilename, name, deflateWorkers)
+                print("%10s %8d %8s %10.4f %12d" % (name, nRows, deflateWorkers or 1, t, size))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""Runs the benchmark suite on synthetic templates (see OpenDocMill.Bench).
+
+    benchSuite.py [-n repeat] [--save baseline.json] [--compare baseline.json]
+                  [--tolerance 0.1] [case ...]
+
+Builds each case's template from blank.odt, prints its compile time, render
+throughput, peak and retained memory and output size, and optionally saves
+the results as a JSON baseline or compares them with one.  With --compare,
+every measurement worse than the baseline's by more than the tolerance is
+listed, and the exit status is 1 if there are any.
+"""
+
+import sys
+import os
+
+scriptdir = os.path.dirname(sys.argv[0])
+libdir = os.path.join(scriptdir, "OpenDocMill")
+if os.path.isdir(libdir):
+    sys.path.append(libdir)
+
+import OpenDocMill
+import OpenDocMill.Bench
+import OpenDocMill.Bench.Baseline
+
+def usage():
+    print("Usage: ", sys.argv[0], "[-n repeat] [--save baseline.json] [--compare baseline.json] [--tolerance 0.1] [case ...]",
+          file=sys.stderr)
+    print("Cases: ", " ".join(x.name for x in OpenDocMill.Bench.SUITE), file=sys.stderr)
+    sys.exit(1)
+
+def main(args):
+    repeat = 3
+    saveFile = None
+    compareFile = None
+    tolerance = 0.1
+    while args and args[0].startswith("-"):
+        if len(args) < 2:
+            usage()
+        if args[0] == "-n" and args[1].isdigit():
+            repeat = int(args[1])
+        elif args[0] == "--save":
+            saveFile = args[1]
+        elif args[0] == "--compare":
+            compareFile = args[1]
+        elif args[0] == "--tolerance":
+            tolerance = float(args[1])
+        else:
+            usage()
+        args = args[2:]
+    try:
+        cases = OpenDocMill.Bench.getCases(args)
+    except ValueError as ex:
+        print(ex, file=sys.stderr)
+        usage()
+    baseline = OpenDocMill.Bench.Baseline.load(compareFile) if compareFile else None
+
+    templateTemplate = os.path.join(scriptdir, "blank.odt")
+    results = {}
+    print("%-22s %9s %9s %10s %8s %9s %9s %9s %9s" % (
+        "case", "compile s", "render s", "rows/s", "MB/s", "out KB", "cpeak MB", "rpeak MB", "kept MB"))
+    for case, result in OpenDocMill.Bench.runSuite(cases, templateTemplate, repeat):
+        results[case.name] = result
+        print("%-22s %9.4f %9.4f %10.0f %8.2f %9.1f %9.2f %9.2f %9.2f" % (
+            case.name, result["compileSeconds"], result["renderSeconds"], result["rowsPerSecond"],
+            result["mbPerSecond"], result["outputBytes"] / 1e3, result["compilePeakBytes"] / 1e6,
+            result["renderPeakBytes"] / 1e6, result["retainedBytes"] / 1e6), flush=True)
+
+    if saveFile:
+        OpenDocMill.Bench.Baseline.save(saveFile, results)
+    if baseline is not None:
+        regressions = OpenDocMill.Bench.Baseline.compare(baseline, results, tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
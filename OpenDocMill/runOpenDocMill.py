@@ -11,43 +11,99 @@ if os.path.isdir(libdir):
 
 try:
     import OpenDocMill
+    import OpenDocMill.Serve
     import json  # Our custom json module
 except ImportError:
     if not os.path.isdir(libdir):
         print("WARNING: Cannot find %r" % libdir, file=sys.stderr)
     raise
 
+### --metrics json|prometheus writes the time taken by each phase, and bytes, rows and images, to stderr.
+### --profile writes the time taken and bytes written by each section, table and row to stderr.
+### --memory writes the memory the compiled template holds, and the peak allocation of each phase, to stderr.
+###
+### --serve keeps running, reading one job per line of input until end of input, each a JSON object
+### {"template": "inTemplate.odt", "out": "outDoc.odt", "data": ...} ("template" may be left out if one is
+### given on the command line), and printing one status line per job, in input order: "ok<TAB>outDoc.odt"
+### or "error<TAB>outDoc.odt<TAB>message".  Compiled templates are kept between jobs (see OpenDocMill.Serve).
+### -j runs the jobs on that many worker processes; --cache-dir also keeps compiled templates on disk.
+### --metrics and --profile report at the end of input, and only see jobs run with -j 1.
+
+def usage():
+    print("Usage: ", progName, "[--metrics json|prometheus] [--profile] [--memory] inTemplate.odt outDoc.odt < data.json", file=sys.stderr)
+    print("       ", progName, "--serve [-j workers] [--cache-dir dir] [--metrics json|prometheus] [--profile] [inTemplate.odt] < jobs.json", file=sys.stderr)
+    sys.exit(1)
+
 progName = sys.argv[0]
 args = sys.argv[1:]
 
-if len(args) != 2:
-    print("Usage: ", progName, "inTemplate.odt outDoc.odt < data.json", file=sys.stderr)
-    sys.exit(1)
+metricsFormat = None
+profile = False
+memory = False
+serve = False
+workers = 1
+cacheDir = None
+while args and args[0].startswith("-"):
+    if args[0] == "--metrics" and len(args) > 1 and args[1] in OpenDocMill.Metrics.FORMATS:
+        metricsFormat = args[1]
+        args = args[2:]
+    elif args[0] == "--profile":
+        profile = True
+        args = args[1:]
+    elif args[0] == "--memory":
+        memory = True
+        args = args[1:]
+    elif args[0] == "--serve":
+        serve = True
+        args = args[1:]
+    elif args[0] == "-j" and len(args) > 1 and args[1].isdigit():
+        workers = int(args[1])
+        args = args[2:]
+    elif args[0] == "--cache-dir" and len(args) > 1:
+        cacheDir = args[1]
+        args = args[2:]
+    else:
+        usage()
+
+if serve:
+    if len(args) > 1 or memory:
+        usage()
+elif len(args) != 2 or workers != 1 or cacheDir:
+    usage()
+
+if metricsFormat or memory:
+    metrics = OpenDocMill.Metrics.enable(memory=memory)
+    OpenDocMill.Metrics.setLogHandler(sys.stderr.write)
+if profile:
+    profiler = OpenDocMill.Profile.enable()
+
+if serve:
+    def writeStatus(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    failed = OpenDocMill.Serve.serve(sys.stdin, writeStatus, workers, args[0] if args else None, cacheDir=cacheDir)
+    if metricsFormat:
+        sys.stderr.write(metrics.export(metricsFormat))
+    if profile:
+        sys.stderr.write(profiler.report())
+    sys.exit(1 if failed else 0)
 
 inTemplate, outDoc = args
 
 input_data = sys.stdin.read()  # read whole multi-line input as string 
 raw_data = json.loads(input_data) 
 
-# Convert the raw data into a ReportData object
-if isinstance(raw_data, dict):
-    # Extract fields, tables, and images from the input data
-    fields = raw_data.get('fields', {})
-    tables = raw_data.get('tables', {})
-    images = raw_data.get('images', {})
-    inputData = OpenDocMill.ReportData(fields=fields, tables=tables, images=images)
-elif isinstance(raw_data, list):
-    # Handle old format
-    if len(raw_data) > 0 and isinstance(raw_data[0], dict):
-        first_section = raw_data[0]
-        fields = first_section.get('fields', {})
-        tables = first_section.get('tables', {})
-        images = first_section.get('images', {})
-        inputData = OpenDocMill.ReportData(fields=fields, tables=tables, images=images)
-    else:
-        inputData = OpenDocMill.ReportData()
-else:
-    inputData = OpenDocMill.ReportData()
+inputData = OpenDocMill.Serve.makeReportData(raw_data)  # as for each --serve job
 
-reportTemplate = OpenDocMill.Reader.readReportODT(inTemplate)  # load template
+if memory:
+    reportTemplate, retained = OpenDocMill.Memory.traceRetained(OpenDocMill.Reader.readReportODT, inTemplate)
+else:
+    reportTemplate = OpenDocMill.Reader.readReportODT(inTemplate)  # load template
 reportTemplate.write(outDoc, inputData)  # add data; create output
+
+if metricsFormat:
+    sys.stderr.write(metrics.export(metricsFormat))
+if profile:
+    sys.stderr.write(profiler.report())
+if memory:
+    sys.stderr.write(OpenDocMill.Memory.report(inTemplate, retained, OpenDocMill.Memory.measureTemplate(reportTemplate), metrics))
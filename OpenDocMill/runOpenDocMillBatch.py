@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+
+scriptdir = os.path.dirname(sys.argv[0])
+libdir = os.path.join(scriptdir, "OpenDocMill")
+if os.path.isdir(libdir):
+    sys.path.append(libdir)
+
+try:
+    import OpenDocMill
+except ImportError:
+    if not os.path.isdir(libdir):
+        print("WARNING: Cannot find %r" % libdir, file=sys.stderr)
+    raise
+
+### Renders one document per line of input, all from the same template.
+### Each line is a JSON object {"out": "outDoc.odt", "data": ...}, "data" being what runOpenDocMill.py reads
+### (or, with --book, a list of dict(name='', fields={}, tables={}, images={}) sections).
+### One line is printed per job, in input order: "ok<TAB>outDoc.odt" or "error<TAB>outDoc.odt<TAB>message".
+### Lines that cannot be read are reported straight away, as "error<TAB>line N<TAB>message".
+### --metrics json|prometheus writes the time taken by each phase, and bytes, rows and images, to stderr at the
+### end; with more than one worker, the documents are written in worker processes and only compiling is counted.
+### --profile writes the time taken and bytes written by each section, table and row to stderr at the end;
+### it needs -j 1, as the profile of a worker process is not sent back.
+### --memory writes the memory the compiled template holds, and the peak allocation of each phase, to stderr at
+### the end; as with --metrics, phases run in worker processes are not seen.
+
+def usage():
+    print("Usage: ", progName, "[--book] [-j workers] [--metrics json|prometheus] [--profile] [--memory] inTemplate.odt < jobs.json", file=sys.stderr)
+    sys.exit(1)
+
+def readJobs(lines, book):
+    for lineNo, line in enumerate(lines, 1):
+        if not line.strip(): continue
+        try:
+            job = json.loads(line)
+            outDoc = job["out"]
+            data = job.get("data", {}) if book else OpenDocMill.Serve.makeReportData(job.get("data", {}))
+        except (ValueError, KeyError, TypeError, OpenDocMill.DataError) as ex:
+            print("error\tline %d\t%s" % (lineNo, OpenDocMill.Serve.oneLine(ex)), flush=True)
+            continue
+        yield outDoc, data
+
+progName = sys.argv[0]
+args = sys.argv[1:]
+
+book = False
+workers = None
+metricsFormat = None
+profile = False
+memory = False
+while args and args[0].startswith("-"):
+    if args[0] == "--book":
+        book = True
+        args = args[1:]
+    elif args[0] == "-j" and len(args) > 1 and args[1].isdigit():
+        workers = int(args[1])
+        args = args[2:]
+    elif args[0] == "--metrics" and len(args) > 1 and args[1] in OpenDocMill.Metrics.FORMATS:
+        metricsFormat = args[1]
+        args = args[2:]
+    elif args[0] == "--profile":
+        profile = True
+        args = args[1:]
+    elif args[0] == "--memory":
+        memory = True
+        args = args[1:]
+    else:
+        usage()
+
+if len(args) != 1:
+    usage()
+
+inTemplate, = args
+
+if metricsFormat or memory:
+    metrics = OpenDocMill.Metrics.enable(memory=memory)
+    OpenDocMill.Metrics.setLogHandler(sys.stderr.write)
+if profile:
+    profiler = OpenDocMill.Profile.enable()
+
+readTemplate = OpenDocMill.Reader.readBookODT if book else OpenDocMill.Reader.readReportODT
+if memory:
+    template, retained = OpenDocMill.Memory.traceRetained(readTemplate, inTemplate)
+else:
+    template = readTemplate(inTemplate)  # load template once
+
+failed = 0
+for outDoc, error in template.writeMany(readJobs(sys.stdin, book), workers):
+    if error is None:
+        print("ok\t%s" % outDoc, flush=True)
+    else:
+        failed += 1
+        print("error\t%s\t%s" % (outDoc, OpenDocMill.Serve.oneLine(error)), flush=True)
+
+if metricsFormat:
+    sys.stderr.write(metrics.export(metricsFormat))
+if profile:
+    sys.stderr.write(profiler.report())
+if memory:
+    sys.stderr.write(OpenDocMill.Memory.report(inTemplate, retained, OpenDocMill.Memory.measureTemplate(template), metrics))
+
+sys.exit(1 if failed else 0)
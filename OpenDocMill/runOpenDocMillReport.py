@@ -1,8 +1,7 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 import sys
 import os
-import codecs
 scriptdir = os.path.dirname(sys.argv[0])
 libdir = os.path.join(scriptdir, "OpenDocMill")
 if os.path.isdir(libdir):
@@ -10,33 +9,62 @@ if os.path.isdir(libdir):
 import json
 try:
     import OpenDocMill
+    import OpenDocMill.Serve
 except ImportError:
     if not os.path.isdir(libdir):
-        print >> sys.stderr, "WARNING: Cannot find %r" % libdir
+        print("WARNING: Cannot find %r" % libdir, file=sys.stderr)
     raise
 
+### As runOpenDocMill.py, but the header and footer are given the same data as the report.
+###
+### --serve keeps running, reading one job per line of input until end of input, each a JSON object
+### {"template": "inTemplate.odt", "out": "outDoc.odt", "data": ...} ("template" may be left out if one is
+### given on the command line), and printing one status line per job, in input order: "ok<TAB>outDoc.odt"
+### or "error<TAB>outDoc.odt<TAB>message".  Compiled templates are kept between jobs (see OpenDocMill.Serve).
+### -j runs the jobs on that many worker processes; --cache-dir also keeps compiled templates on disk.
+
+def usage():
+    print("Usage: ", progName, "inTemplate.odt outDoc.odt < data.json", file=sys.stderr)
+    print("       ", progName, "--serve [-j workers] [--cache-dir dir] [inTemplate.odt] < jobs.json", file=sys.stderr)
+    sys.exit(1)
+
 progName = sys.argv[0]
 args = sys.argv[1:]
 
-if len(args) != 2:
-    print >> sys.stderr, "Usage: ", progName, "inTemplate.odt outDoc.odt < data.json"
-    sys.exit(1)
+serve = False
+workers = 1
+cacheDir = None
+while args and args[0].startswith("-"):
+    if args[0] == "--serve":
+        serve = True
+        args = args[1:]
+    elif args[0] == "-j" and len(args) > 1 and args[1].isdigit():
+        workers = int(args[1])
+        args = args[2:]
+    elif args[0] == "--cache-dir" and len(args) > 1:
+        cacheDir = args[1]
+        args = args[2:]
+    else:
+        usage()
+
+if serve:
+    if len(args) > 1:
+        usage()
+    def writeStatus(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+    failed = OpenDocMill.Serve.serve(sys.stdin, writeStatus, workers, args[0] if args else None,
+                                     headFoot=True, cacheDir=cacheDir)
+    sys.exit(1 if failed else 0)
+
+if len(args) != 2 or workers != 1 or cacheDir:
+    usage()
 
 inTemplate, outDoc = args
-# TODO check with  utf-8 encoded data.
 input = sys.stdin.read() # read whole multi-line input as string
 
-inputData = json.read(input) # convert to list of (page info data structure)
-fields    = inputData.get("fields", {})
-tables    = inputData.get("tables", {})
-images    = inputData.get("images", {})
-# print("FIELDS: %r" % (fields,))
-# print("TABLES: %r" % (tables,))
-# print( "IMAGES: %r" % (images,))
-
-reportData = OpenDocMill.ReportData(fields=fields, tables=tables, images=images)
-reportData.setHeaderData(fields=fields, tables=tables, images=images)
-reportData.setFooterData(fields=fields, tables=tables, images=images)
+inputData = json.loads(input)
+reportData = OpenDocMill.Serve.makeReportData(inputData, headFoot=True)
 
 reportTemplate = OpenDocMill.Reader.readReportODT(inTemplate) # load template
 reportTemplate.write(outDoc, reportData) # add data; create output
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""The on-disk cache of compiled templates (OpenDocMill.Cache)"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+scriptdir = os.path.dirname(testdir)
+sys.path.insert(0, scriptdir)
+
+import OpenDocMill
+import OpenDocMill.Cache
+import OpenDocMill.Metrics
+import OpenDocMill.Reader
+
+templateName = os.path.join(scriptdir, "invoiceTemplate.odt")
+
+def invoiceData():
+    with open(os.path.join(scriptdir, "blob.json")) as f:
+        data = json.load(f)[0]
+    return OpenDocMill.ReportData(fields=data["fields"], tables=data["tables"])
+
+def render(template):
+    """{name: uncompressed bytes} of the members of the document written from template"""
+    out = io.BytesIO()
+    template.write(out, invoiceData())
+    with zipfile.ZipFile(out) as z:
+        if z.testzip() is not None:
+            raise AssertionError("Bad CRC for %r" % z.testzip())
+        return dict((info.filename, z.read(info)) for info in z.infolist())
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp()
+        self.messages = []
+        OpenDocMill.Metrics.setLogHandler(self.messages.append)
+
+    def tearDown(self):
+        OpenDocMill.Metrics.setLogHandler(None)
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+    def testUnwritableCacheDirStillCompiles(self):
+        cacheDir = os.path.join(self.cacheDir, "notADir")
+        with open(cacheDir, "w"):
+            pass
+        template = OpenDocMill.Reader.readReportODT(templateName, cacheDir=os.path.join(cacheDir, "cache"))
+        self.assertTrue(render(template))
+        self.assertTrue(any("not caching" in message for message in self.messages))
+
+    def testCachedTemplateWritesTheSame(self):
+        expected = render(OpenDocMill.Reader.readReportODT(templateName))
+        for _ in range(2):
+            template = OpenDocMill.Reader.readReportODT(templateName, cacheDir=self.cacheDir)
+            self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+        self.assertEqual(render(template), expected)
+
+    def testUseDOMIsPartOfTheKey(self):
+        cache = OpenDocMill.Cache.DiskCache(self.cacheDir)
+        self.assertNotEqual(cache.getKey(templateName, "report", False),
+                            cache.getKey(templateName, "report", True))
+        calls = []
+        def compile(filename, useDOM):
+            calls.append(useDOM)
+            return OpenDocMill.Reader.compileReportODT(filename, useDOM)
+        cache.read(templateName, "report", compile, useDOM=True)
+        cache.read(templateName, "report", compile, useDOM=False)
+        cache.read(templateName, "report", compile, useDOM=True)
+        self.assertEqual(calls, [True, False])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""Generated render functions (OpenDocMill.CodeGen) fail as the interpreters do"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+scriptdir = os.path.dirname(testdir)
+sys.path.insert(0, scriptdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+
+templateName = os.path.join(scriptdir, "invoiceTemplate.odt")
+
+class BadValue(object):
+    def __str__(self):
+        raise KeyError("inside __str__")
+
+def badImage():
+    raise KeyError("inside the image source")
+
+def invoiceData(fields=None, rowFields=None, images=None):
+    with open(os.path.join(scriptdir, "blob.json")) as f:
+        data = json.load(f)[0]
+    data["fields"].update(fields or {})
+    for name, value in (rowFields or {}).items():
+        table = next(iter(data["tables"].values()))
+        if value is None:
+            del table[0][name]
+        else:
+            table[0][name] = value
+    return OpenDocMill.ReportData(fields=data["fields"], tables=data["tables"], images=images or {})
+
+class EngineErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.template = OpenDocMill.Reader.readReportODT(templateName)
+        OpenDocMill.setValidation("off")
+        with open(os.path.join(scriptdir, "blob.json")) as f:
+            data = json.load(f)[0]
+        self.field = sorted(data["fields"])[0]
+        self.column = sorted(next(iter(data["tables"].values()))[0])[0]
+
+    def tearDown(self):
+        OpenDocMill.setValidation("default")
+
+    def getErrors(self, data):
+        """(type, message) of the error writing data raises, with each engine"""
+        errors = []
+        for engine in ("interpreted", "compiled"):
+            self.template.setRenderEngine(engine)
+            with self.assertRaises(Exception) as cm:
+                self.template.write(io.BytesIO(), data)
+            errors.append((type(cm.exception), str(cm.exception)))
+        return errors
+
+    def assertSameErrors(self, data, errorType, text):
+        interpreted, compiled = self.getErrors(data)
+        self.assertEqual(compiled, interpreted)
+        self.assertIs(compiled[0], errorType)
+        self.assertIn(text, compiled[1])
+
+    def testMissingField(self):
+        data = invoiceData()
+        del data.mainSection.fields[self.field]
+        self.assertSameErrors(data, ValueError, repr(self.field))
+
+    def testKeyErrorInValue(self):
+        self.assertSameErrors(invoiceData(fields={self.field: BadValue()}), KeyError, "inside __str__")
+
+    def testKeyErrorInImage(self):
+        self.assertSameErrors(invoiceData(images={"graphics1": badImage}), KeyError, "inside the image source")
+
+    def testMissingRowField(self):
+        self.assertSameErrors(invoiceData(rowFields={self.column: None}), ValueError, repr(self.column))
+
+    def testKeyErrorInRowValue(self):
+        self.assertSameErrors(invoiceData(rowFields={self.column: BadValue()}), KeyError, "inside __str__")
+
+if __name__ == "__main__":
+    unittest.main()
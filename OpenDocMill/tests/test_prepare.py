@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""Compiled templates are complete before the first write (ODTFileTemplate.prepare)"""
+
+import io
+import json
+import os
+import pickle
+import sys
+import unittest
+import zipfile
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+scriptdir = os.path.dirname(testdir)
+sys.path.insert(0, scriptdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+
+templateName = os.path.join(scriptdir, "invoiceTemplate.odt")
+
+def invoiceData():
+    with open(os.path.join(scriptdir, "blob.json")) as f:
+        data = json.load(f)[0]
+    return OpenDocMill.ReportData(fields=data["fields"], tables=data["tables"])
+
+def walk(template):
+    """Every Section and Row of template"""
+    todo = list(template.contentTemplate.getSections()) + list(template.stylesTemplate.getSections())
+    while todo:
+        ob = todo.pop()
+        yield ob
+        if isinstance(ob, OpenDocMill.Section):
+            todo.extend(eVal[1].row for eType, eVal in ob.elements if eType == "TABLE")
+
+class PrepareTest(unittest.TestCase):
+    def setUp(self):
+        self.template = OpenDocMill.Reader.readReportODT(templateName)
+
+    def testCompiledFormIsComplete(self):
+        obs = list(walk(self.template))
+        self.assertTrue(any(isinstance(ob, OpenDocMill.Row) for ob in obs))
+        for ob in obs:
+            self.assertIsInstance(ob.elements, tuple)
+            self.assertIsNotNone(ob.renderFunction)
+        with zipfile.ZipFile(templateName) as z:
+            copied = set(z.namelist()) - set(["content.xml", "styles.xml", "META-INF/manifest.xml"])
+        self.assertEqual(set(name for name, compression in self.template.rawMembers), copied)
+
+    def testWriteAddsNothing(self):
+        functions = [ob.renderFunction for ob in walk(self.template)]
+        rawMembers = dict(self.template.rawMembers)
+        self.template.writeBytes(invoiceData())
+        self.assertEqual([ob.renderFunction for ob in walk(self.template)], functions)
+        self.assertEqual(self.template.rawMembers, rawMembers)
+
+    def testPreparedAgainAfterPickling(self):
+        template = pickle.loads(pickle.dumps(self.template))
+        self.assertTrue(all(ob.renderFunction is None for ob in walk(template)))
+        template.prepare()
+        self.assertTrue(all(ob.renderFunction is not None for ob in walk(template)))
+        self.assertEqual(template.writeBytes(invoiceData()), self.template.writeBytes(invoiceData()))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Strict validation (OpenDocMill.Schema) against invoiceTemplate.odt"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+scriptdir = os.path.dirname(testdir)
+sys.path.insert(0, scriptdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+
+def invoiceData(images):
+    with open(os.path.join(scriptdir, "blob.json")) as f:
+        data = json.load(f)[0]
+    return OpenDocMill.ReportData(fields=data["fields"], tables=data["tables"], images=images)
+
+class SchemaImageTest(unittest.TestCase):
+    def setUp(self):
+        self.template = OpenDocMill.Reader.readReportODT(os.path.join(scriptdir, "invoiceTemplate.odt"))
+        OpenDocMill.setValidation("strict")
+
+    def tearDown(self):
+        OpenDocMill.setValidation("default")
+
+    def testBadImageRejectedBeforeWriting(self):
+        data = invoiceData({"graphics1": 42})
+        with self.assertRaises(OpenDocMill.DataError) as cm:
+            self.template.validate(data)
+        self.assertIn("'graphics1'", str(cm.exception))
+        out = io.BytesIO()
+        with self.assertRaises(OpenDocMill.DataError):
+            self.template.write(out, data)
+        self.assertEqual(out.getvalue(), b"")
+
+    def testGoodAndMissingImagesAccepted(self):
+        self.template.validate(invoiceData({"graphics1": b"\x89PNG\r\n\x1a\n"}))
+        self.template.validate(invoiceData({}))
+
+    def testUnusedImageNotChecked(self):
+        # only the images the template uses are checked in strict mode
+        self.template.validate(invoiceData({"notInTemplate": 42}))
+
+if __name__ == "__main__":
+    unittest.main()
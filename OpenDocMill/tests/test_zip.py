@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+"""Writing zip members through zipfile's internals (OpenDocMill.Zip): raw
+copies and parallel deflate, to seekable and non-seekable output"""
+
+import io
+import json
+import os
+import sys
+import unittest
+import zipfile
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+scriptdir = os.path.dirname(testdir)
+sys.path.insert(0, scriptdir)
+
+import OpenDocMill
+import OpenDocMill.Reader
+import OpenDocMill.Zip
+
+templateName = os.path.join(scriptdir, "invoiceTemplate.odt")
+
+class Unseekable(object):
+    """A binary stream that can only be written to, like a socket"""
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+def invoiceData():
+    with open(os.path.join(scriptdir, "blob.json")) as f:
+        data = json.load(f)[0]
+    return OpenDocMill.ReportData(fields=data["fields"], tables=data["tables"])
+
+def readMembers(archive):
+    """{name: uncompressed bytes} of a zip archive given as bytes, once zipfile has checked it"""
+    with zipfile.ZipFile(io.BytesIO(archive)) as z:
+        bad = z.testzip()
+        if bad is not None:
+            raise AssertionError("Bad CRC for %r" % bad)
+        return dict((info.filename, z.read(info)) for info in z.infolist())
+
+class ZipOutputTest(unittest.TestCase):
+    def setUp(self):
+        with open(templateName, "rb") as f:
+            self.templateBytes = f.read()
+        self.templateMembers = readMembers(self.templateBytes)
+
+    def testRawMembersRoundTrip(self):
+        for out in (io.BytesIO(), Unseekable()):
+            with zipfile.ZipFile(io.BytesIO(self.templateBytes)) as inZip:
+                with zipfile.ZipFile(out, "w") as outZip:
+                    for info in inZip.infolist():
+                        OpenDocMill.Zip.writeRawMember(outZip, info, OpenDocMill.Zip.readRawMember(inZip, info))
+            self.assertEqual(readMembers(out.getvalue()), self.templateMembers)
+
+    def testDocumentRoundTrip(self):
+        template = OpenDocMill.Reader.readReportODT(templateName)
+        members = []
+        for out in (io.BytesIO(), Unseekable()):
+            template.write(out, invoiceData())
+            members.append(readMembers(out.getvalue()))
+        self.assertEqual(members[0], members[1])
+        for name, data in self.templateMembers.items():
+            if name not in ("content.xml", "styles.xml", "META-INF/manifest.xml"):
+                self.assertEqual(members[0][name], data, name)
+
+    def testParallelDeflateRoundTrip(self):
+        template = OpenDocMill.Reader.readReportODT(templateName)
+        document = template.writeBytes(invoiceData())
+        expected = readMembers(document)
+        content = expected.pop("content.xml")
+        content *= 3 * (1 << 17) // len(content) + 1 # several blocks
+        for out in (io.BytesIO(), Unseekable()):
+            with zipfile.ZipFile(io.BytesIO(document)) as inZip:
+                with zipfile.ZipFile(out, "w") as outZip:
+                    for info in inZip.infolist():
+                        if info.filename != "content.xml":
+                            OpenDocMill.Zip.writeRawMember(outZip, info, OpenDocMill.Zip.readRawMember(inZip, info))
+                            continue
+                        info = OpenDocMill.Zip.applyCompression(info, (zipfile.ZIP_DEFLATED, 6))
+                        writer = OpenDocMill.ZipEntryWriter(outZip, info, chunkSize=1000, deflateWorkers=3, parallelThreshold=len(content) // 4)
+                        for i in range(0, len(content), 777):
+                            writer.write(content[i:i + 777])
+                        self.assertIsInstance(writer.entry, OpenDocMill.Zip.ParallelDeflateWriter)
+                        self.assertTrue(writer.close())
+                        self.assertEqual(writer.entry.blocks, 4)
+            members = readMembers(out.getvalue())
+            self.assertEqual(members.pop("content.xml"), content)
+            self.assertEqual(members, expected)
+
+    def testLargeWriteIsSplitIntoBlocks(self):
+        data = b"".join(b"%d\n" % i for i in range(100000)) # 588890 bytes
+        blockSize = 1 << 17
+        for out in (io.BytesIO(), Unseekable()):
+            with zipfile.ZipFile(out, "w") as outZip:
+                info = zipfile.ZipInfo("numbers.txt")
+                info.compress_type = zipfile.ZIP_DEFLATED
+                writer = OpenDocMill.Zip.ParallelDeflateWriter(outZip, info, 3, blockSize)
+                writer.write(data)
+                self.assertEqual(writer.blocks, len(data) // blockSize)
+                writer.close()
+                self.assertEqual(writer.blocks, len(data) // blockSize + 1)
+            self.assertEqual(readMembers(out.getvalue()), {"numbers.txt": data})
+
+    def testMissingInternalsRaise(self):
+        class OldZipFile(zipfile.ZipFile):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                del self._didModify
+        with OldZipFile(io.BytesIO(), "w") as outZip:
+            self.assertFalse(OpenDocMill.Zip.internalsSupported(outZip))
+            with self.assertRaises(OpenDocMill.Zip.ZipInternalsError) as cm:
+                OpenDocMill.Zip.writeRawMember(outZip, zipfile.ZipInfo("a.txt"), b"a")
+            outZip._didModify = False
+        self.assertIn("_didModify", str(cm.exception))
+        self.assertNotIn("a.txt", outZip.NameToInfo)
+
+class UncheckedPythonTest(unittest.TestCase):
+    """As on a Python the zipfile internals were not written against"""
+    def setUp(self):
+        self.expected = readMembers(OpenDocMill.Reader.readReportODT(templateName).writeBytes(invoiceData()))
+        self.versions = OpenDocMill.Zip.ZIPFILE_VERSIONS
+        OpenDocMill.Zip.ZIPFILE_VERSIONS = ((3, 0), (3, 0))
+        OpenDocMill.Zip.supportedTypes.clear()
+
+    def tearDown(self):
+        OpenDocMill.Zip.ZIPFILE_VERSIONS = self.versions
+        OpenDocMill.Zip.supportedTypes.clear()
+
+    def testInternalsRaise(self):
+        with zipfile.ZipFile(io.BytesIO(), "w") as outZip:
+            self.assertFalse(OpenDocMill.Zip.internalsSupported(outZip))
+            with self.assertRaises(OpenDocMill.Zip.ZipInternalsError):
+                OpenDocMill.Zip.writeRawMember(outZip, zipfile.ZipInfo("a.txt"), b"a")
+
+    def testDocumentFallsBack(self):
+        template = OpenDocMill.Reader.readReportODT(templateName)
+        for out in (io.BytesIO(), Unseekable()):
+            template.write(out, invoiceData())
+            self.assertEqual(readMembers(out.getvalue()), self.expected)
+        self.assertIsNone(template.rawMembers)
+
+    def testParallelDeflateFallsBack(self):
+        content = b"<text>%s</text>" % (b"x" * 5000)
+        for out in (io.BytesIO(), Unseekable()):
+            with zipfile.ZipFile(out, "w") as outZip:
+                info = OpenDocMill.Zip.applyCompression(zipfile.ZipInfo("content.xml"), (zipfile.ZIP_DEFLATED, 6))
+                writer = OpenDocMill.ZipEntryWriter(outZip, info, chunkSize=1000, deflateWorkers=3, parallelThreshold=1000)
+                writer.write(content)
+                self.assertNotIsInstance(writer.entry, OpenDocMill.Zip.ParallelDeflateWriter)
+                self.assertTrue(writer.close())
+            self.assertEqual(readMembers(out.getvalue()), {"content.xml": content})
+
+if __name__ == "__main__":
+    unittest.main()